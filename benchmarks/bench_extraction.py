@@ -0,0 +1,53 @@
+"""
+Compare the text extraction backends: how many statements per second
+each gets through, and whether they give parse_text the same tokens.
+
+    python benchmarks/bench_extraction.py [statement.pdf] [--repeat N]
+
+Defaults to the bundled synthetic-statement.pdf. Backends that aren't
+available here (no pdftotext, no pdfminer.six) are skipped.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from text_extraction import BACKENDS, extract_lines
+
+
+def tokens(fn, backend):
+    return [line.split() for line in extract_lines(fn, backend) if line.strip()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("statement", nargs='?', default=os.path.join(HERE, 'synthetic-statement.pdf'))
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    reference = None
+    for backend in BACKENDS:
+        try:
+            result = tokens(args.statement, backend)
+        except (OSError, ImportError) as err:
+            print(f'{backend:<10} skipped: {err}')
+            continue
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            tokens(args.statement, backend)
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference = (backend, result)
+            same = ''
+        elif result == reference[1]:
+            same = f'  tokens match {reference[0]}'
+        else:
+            same = f'  TOKENS DIFFER FROM {reference[0]}'
+        print(f'{backend:<10} {args.repeat / elapsed:8.1f} statements/s  '
+              f'{len(result) * args.repeat / elapsed:10.0f} lines/s{same}')
@@ -0,0 +1,96 @@
+"""
+How long does it take just to start up? Runs `python -X importtime` on
+betterment_pdf_to_qif, ticker_registry and compare-holdings.py in fresh
+interpreters and reports what their imports cost, over and above what
+a bare `python -c pass` imports anyway.
+
+    python benchmarks/bench_import.py            # report
+    python benchmarks/bench_import.py --check    # and enforce the budgets
+
+With --check, exits non-zero if any of them goes over its budget in
+milliseconds (the best of --repeat runs), or if a plain conversion
+imports one of the modules that should only be loaded when they're
+used: asyncio, concurrent.futures, sqlite3 and so on. The budgets are
+generous, since machines differ; the list of modules is exact.
+"""
+
+import os
+import sys
+import argparse
+import compileall
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+# what each target runs, its budget in milliseconds, and any modules
+# besides LAZY it shouldn't import
+TARGETS = {
+    'betterment_pdf_to_qif': (['-c', 'import betterment_pdf_to_qif'], 50, []),
+    'ticker_registry': (['-c', 'import ticker_registry'], 10, []),
+    'compare-holdings.py': (['compare-holdings.py', '--help'], 50, ['betterment_pdf_to_qif']),
+}
+
+# only the batch, watch, async, cache, index and numpy code needs these
+LAZY = ['asyncio', 'concurrent.futures', 'sqlite3', 'pickle', 'hashlib',
+        'cProfile', 'difflib', 'glob', 'numpy', 'pdfminer', 'export_index',
+        'statement_cache', 'watch_folder', 'holdings_ledger', 'page_parallel',
+        'statement_archive', 'mmap']
+
+
+def importtime(args, env=None):
+    """{module: cumulative microseconds} for the top-level imports the
+    command makes, run with the environment env (default: ours)"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=ROOT, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          text=True, check=True)
+    ret = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip() == 'cumulative':
+            continue
+        # the name is indented one space more for each level of nesting
+        ret.setdefault(name[1:].rstrip(), int(cumulative))
+    return ret
+
+
+def top_level(times):
+    return {name: us for name, us in times.items() if not name.startswith(' ')}
+
+
+def cost(args, startup, env=None):
+    """milliseconds of imports beyond a bare interpreter's, and every
+    module imported"""
+    times = importtime(args, env)
+    extra = sum(us for name, us in top_level(times).items() if name not in startup)
+    return extra / 1000, {name.strip() for name in times}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--check", action='store_true', help="fail if over budget or a lazy module was imported")
+    args = parser.parse_args()
+
+    # time the imports as they'd normally run, from .pyc files, even if
+    # PYTHONDONTWRITEBYTECODE kept them from being written
+    compileall.compile_dir(ROOT, maxlevels=0, quiet=1)
+    startup = set(top_level(importtime(['-c', 'pass'])))
+    failed = []
+    for target, (cmd, budget, lazy) in TARGETS.items():
+        best = None
+        for _ in range(args.repeat):
+            ms, modules = cost(cmd, startup)
+            best = ms if best is None else min(best, ms)
+        eager = sorted(m for m in LAZY + lazy if m in modules)
+        print(f'{target:<24} {best:8.1f} ms   (budget {budget} ms)')
+        if best > budget:
+            failed.append(f'{target} took {best:.1f} ms')
+        for m in eager:
+            print(f'    imports {m} at startup')
+            failed.append(f'{target} imports {m}')
+    if args.check and failed:
+        print('over budget:', '; '.join(failed))
+        sys.exit(1)
@@ -0,0 +1,101 @@
+"""
+How fast do we recognize goal and section headers, tickers and dates?
+
+Runs the old per-line checks (join the line once per header, compare
+list slices, try/except on every ticker lookup) and the compiled
+grammar and lookups in betterment_pdf_to_qif over the same synthetic statement
+text, repeated to make a large input, and reports lines per second.
+
+    python benchmarks/bench_matcher.py [--copies N]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import betterment_pdf_to_qif as b
+from synthetic_statement import statement_lines
+
+
+def old_tickerindex(line):
+    for i, s in enumerate(line):
+        try:
+            _ = b.ticker_to_name[s]
+            return i
+        except KeyError:
+            pass
+    raise ValueError
+
+
+def old_has_month(line):
+    months = b.mon_to_num.keys()
+    for piece in line:
+        if piece in months:
+            return True
+    return False
+
+
+def old_classify(line):
+    goal = section = None
+    if line[:2] == 'build wealth'.split():
+        goal = 'build wealth'
+    elif line[:2] == 'safety net'.split():
+        goal = 'safety net'
+    elif line[:3] == 'world cup 2026'.split():
+        goal = 'world cup 2026'
+    elif line[:2] == 'smart saver'.split():
+        goal = 'smart saver'
+    if 'dividend payment detail' in ' '.join(line):
+        section = 'dividend'
+    elif 'quarterly activity detail' in ' '.join(line):
+        section = 'other'
+    elif 'monthly activity detail' in ' '.join(line):
+        section = 'other'
+    elif 'snapshot activity detail' in ' '.join(line):
+        section = 'other'
+    try:
+        ticker = old_tickerindex(line)
+    except ValueError:
+        ticker = None
+    # in the grammar's terms: the goal's name, None for the end of the
+    # goals, False for no goal marker
+    goal = False if goal is None else b.GRAMMAR.goals[goal]
+    return goal, section, ticker, old_has_month(line)
+
+
+def new_classify(line):
+    goal = b.GRAMMAR.match_goal(line)
+    section = b.GRAMMAR.match_section(line)
+    try:
+        ticker = b.tickerindex(line)
+    except ValueError:
+        ticker = None
+    return goal, section, ticker, not b.months.isdisjoint(line)
+
+
+def lines_per_second(classify, txt):
+    start = time.perf_counter()
+    for line in txt:
+        classify(line)
+    return len(txt) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=2000,
+                        help="how many copies of the synthetic statement to run through")
+    args = parser.parse_args()
+
+    one = [line.lower().split() for line in statement_lines() if line.strip()]
+    txt = one * args.copies
+
+    assert [old_classify(line) for line in one] == [new_classify(line) for line in one]
+    old = lines_per_second(old_classify, txt)
+    new = lines_per_second(new_classify, txt)
+    print(f'{len(txt)} lines')
+    print(f'old checks    {old:12,.0f} lines/s')
+    print(f'grammar       {new:12,.0f} lines/s   ({new / old:.2f}x)')
@@ -0,0 +1,158 @@
+"""
+Benchmarks for the parsing code at several statement sizes, tracked
+against a stored baseline so we can tell whether a change made things
+faster or slower.
+
+    python benchmarks/bench_pipeline.py                  # compare with baseline
+    python benchmarks/bench_pipeline.py --save-baseline  # record a new one
+    python benchmarks/bench_pipeline.py --scales 1,100 --check 1.25
+
+Sizes are multiples of one synthetic statement (see
+synthetic_statement.py). With --check, exits non-zero if anything is
+more than that factor slower than the baseline, or has no baseline to
+check against. Baselines are only comparable on the same machine, so
+the baseline file isn't checked in; save one before making a change.
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import contextlib
+import importlib.util
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import betterment_pdf_to_qif as b
+from synthetic_statement import archive_lines, tokenized, write_moneydance_csv
+from token_format import write_tokens
+
+
+def load_compare_holdings():
+    # the file name has a hyphen in it, so no plain import
+    spec = importlib.util.spec_from_file_location(
+        'compare_holdings', os.path.join(ROOT, 'compare-holdings.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_parse_text(txt, tmp):
+    b.parse_text(txt)
+
+
+def bench_parse_other_activity(txt, tmp):
+    for line in txt:
+        try:
+            b.parse_other_activity(line)
+        except ValueError:
+            pass
+
+
+def bench_create_qif(txt, tmp):
+    b.create_qif(bench_create_qif.transactions, os.path.join(tmp, 'bench'))
+
+
+def bench_statement_parser(txt, tmp):
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        bench_statement_parser.module.BettermentStatementParser(bench_statement_parser.debug_file)
+
+
+def bench_moneydance_parser(txt, tmp):
+    bench_moneydance_parser.module.MoneydanceExtractDataParser(bench_moneydance_parser.csv_file)
+
+
+BENCHMARKS = [bench_parse_text, bench_parse_other_activity, bench_create_qif,
+              bench_statement_parser, bench_moneydance_parser]
+
+
+def setup(scale, tmp, compare_holdings):
+    """the inputs each benchmark needs at this scale"""
+    lines = archive_lines(scale)
+    txt = tokenized(lines)
+    bench_create_qif.transactions = b.parse_text(txt)
+
+    # compare-holdings reads the -debug.txt file run() writes
+    debug_file = os.path.join(tmp, 'statement.pdf-debug.txt')
+    with open(debug_file, 'w') as f:
+        for _ in write_tokens(tokenized(lines, lower=False), f):
+            pass
+    bench_statement_parser.module = compare_holdings
+    bench_statement_parser.debug_file = debug_file
+
+    csv_file = os.path.join(tmp, 'moneydance.csv')
+    write_moneydance_csv(csv_file, scale=scale)
+    bench_moneydance_parser.module = compare_holdings
+    bench_moneydance_parser.csv_file = csv_file
+    return txt
+
+
+def run_benchmarks(scales, repeat):
+    compare_holdings = load_compare_holdings()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            txt = setup(scale, tmp, compare_holdings)
+            for bench in BENCHMARKS:
+                # fewer repeats for the big inputs; the best of them is
+                # the least noisy number
+                times = []
+                for _ in range(max(1, repeat // scale)):
+                    start = time.perf_counter()
+                    bench(txt, tmp)
+                    times.append(time.perf_counter() - start)
+                name = f'{bench.__name__[len("bench_"):]}@{scale}x'
+                results[name] = min(times)
+                print(f'{name:<32} {min(times) * 1000:12.3f} ms', flush=True)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", default='1,100,10000', help="comma-separated statement multiples (default: 1,100,10000)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--baseline", default=os.path.join(HERE, 'baseline.json'))
+    parser.add_argument("--save-baseline", action='store_true')
+    parser.add_argument("--check", type=float, default=None, metavar="FACTOR",
+                        help="fail if any benchmark is this many times slower than the baseline")
+    args = parser.parse_args()
+    if args.check is not None and not args.save_baseline and not os.path.exists(args.baseline):
+        parser.error(f'--check needs a baseline and there is none at {args.baseline}; '
+                     'run with --save-baseline first, on this machine')
+
+    results = run_benchmarks([int(s) for s in args.scales.split(',')], args.repeat)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('saved baseline to', args.baseline)
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print('no baseline at', args.baseline, '- run with --save-baseline first')
+        sys.exit(0)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    slower = []
+    missing = []
+    print()
+    for name, seconds in results.items():
+        if name not in baseline:
+            print(f'{name:<32}   not in baseline')
+            missing.append(name)
+            continue
+        ratio = seconds / baseline[name]
+        print(f'{name:<32} {ratio:6.2f}x baseline')
+        if args.check is not None and ratio > args.check:
+            slower.append(name)
+    if slower:
+        print('slower than baseline:', ', '.join(slower))
+    if args.check is not None and missing:
+        print('not checked, no baseline:', ', '.join(missing))
+    if slower or (args.check is not None and missing):
+        sys.exit(1)
@@ -0,0 +1,257 @@
+"""
+Is a faster way of parsing statements still right? Runs each engine --
+the current one (parse_text, then create_qif) and the alternatives --
+over the same statements, checks that every engine gives the expected
+transactions and byte-for-byte the expected QIF files, and reports how
+much faster (or slower) each one is than the current one.
+
+    python benchmarks/golden_engines.py                      # synthetic statements
+    python benchmarks/golden_engines.py s/*.pdf-debug.txt    # and real ones
+    python benchmarks/golden_engines.py --engine pages --scale 1000
+
+The statements are token files (the -debug.txt files run() writes) and
+synthetic ones (see synthetic_statement.py): a few single statements,
+a short archive, and one archive of --scale of them.
+
+What's expected comes from benchmarks/golden/<statement>/: the QIF
+files and transactions.txt, written once and checked in, so a change
+to the current engine shows up here as well. A statement with no
+golden files (your own, or another --scale) is checked against the
+current engine instead, which only says the engines agree. After a
+change that's meant to alter the output, look at the diffs and then
+rewrite the golden files with --update-golden.
+
+Exits non-zero if any engine's output differs, so an engine should
+only be switched on once this passes on a real archive.
+
+An engine is a function from tokenized, lowercased lines to a list of
+transactions, fee payments included, and a function that writes them
+as QIF files; add new ones to ENGINES.
+"""
+
+import os
+import sys
+import time
+import difflib
+import argparse
+import tempfile
+import collections
+from decimal import Decimal
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import betterment_pdf_to_qif as b
+import page_parallel
+import transaction_table
+from synthetic_statement import statement_lines, archive_lines, tokenized
+from token_format import read_tokens
+
+# as many lines as synthetic_statement.write_pdf puts on a page
+LINES_PER_PAGE = 60
+GOLDEN = os.path.join(HERE, 'golden')
+# the archive that has golden files, long enough for several pages and
+# for goals to come round again
+GOLDEN_SCALE = 2
+
+
+def pages_of(txt):
+    return [txt[i:i + LINES_PER_PAGE] for i in range(0, len(txt), LINES_PER_PAGE)]
+
+
+def parse_streaming(txt):
+    """the pipeline run() uses: one line at a time, through generators"""
+    return list(b.with_fee_payments(b.iter_transactions(iter(txt))))
+
+
+def parse_pages(txt):
+    """page_parallel's runs and merge, in this process, one run per page"""
+    pages = pages_of(txt)
+    transactions, _, _ = page_parallel.parse_pages(pages, 1, runs=len(pages))
+    return transactions
+
+
+def parse_pages_pool(txt):
+    """page_parallel with a pool of --workers processes"""
+    transactions, _, _ = page_parallel.parse_pages(pages_of(txt), parse_pages_pool.workers)
+    return transactions
+
+
+parse_pages_pool.workers = None
+
+
+def parse_columnar(txt):
+    """parse_text, through a TransactionTable's arrays and back"""
+    table = transaction_table.TransactionTable(b.parse_text(txt))
+    return [table.transaction(i) for i in range(len(table))]
+
+
+# name: (parse, write QIF files given a file name prefix)
+ENGINES = collections.OrderedDict([
+    ('current', (b.parse_text, b.create_qif)),
+    ('streaming', (parse_streaming, b.create_qif)),
+    ('pages', (parse_pages, b.create_qif)),
+    ('pages-pool', (parse_pages_pool, b.create_qif)),
+    ('columnar', (parse_columnar, b.create_qif)),
+])
+
+
+def corpus(token_files, seeds, scale):
+    """[(name, tokenized lowercased lines), ...]"""
+    ret = [(fn, list(b.lowercase(read_tokens(fn)))) for fn in token_files]
+    for seed in range(seeds):
+        ret.append((f'synthetic-{seed}', tokenized(statement_lines(seed=seed))))
+    ret.append((f'archive-{GOLDEN_SCALE}x', tokenized(archive_lines(GOLDEN_SCALE))))
+    if scale and scale != GOLDEN_SCALE:
+        ret.append((f'archive-{scale}x', tokenized(archive_lines(scale))))
+    return ret
+
+
+def golden_dir(name):
+    return os.path.join(GOLDEN, os.path.basename(name))
+
+
+def canonical(transactions):
+    """one line of text per transaction, the Decimals without trailing
+    zeros, since two Decimals that compare equal needn't print alike"""
+    ret = []
+    for t in transactions:
+        fields = [t.kind.value, t.goal, t.date, t.ticker, t.desc,
+                  t.share_price, t.shares, t.amount, t.reported_shares]
+        ret.append('\t'.join('' if f is None
+                             else format(f.normalize(), 'f') if isinstance(f, Decimal)
+                             else str(f) for f in fields) + '\n')
+    return ''.join(ret)
+
+
+def read_golden(name):
+    """(canonical transactions, {QIF file name: contents}) for a
+    statement, or None if it has no golden files"""
+    directory = golden_dir(name)
+    if not os.path.isdir(directory):
+        return None
+    qif = {}
+    for fn in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, fn), 'rb') as f:
+            qif[fn] = f.read()
+    return qif.pop('transactions.txt').decode('utf-8'), qif
+
+
+def write_golden(name, transactions, qif):
+    """save canonical transactions and QIF files as a statement's
+    golden files"""
+    directory = golden_dir(name)
+    if os.path.isdir(directory):
+        for fn in os.listdir(directory):
+            os.remove(os.path.join(directory, fn))
+    else:
+        os.makedirs(directory)
+    with open(os.path.join(directory, 'transactions.txt'), 'w', encoding='utf-8', newline='') as f:
+        f.write(transactions)
+    for fn, data in qif.items():
+        with open(os.path.join(directory, fn), 'wb') as f:
+            f.write(data)
+
+
+def run_engine(engine, txt, directory, repeat):
+    """(transactions, {QIF file name: contents}, best parse seconds,
+    best QIF seconds)"""
+    parse, write = engine
+    parse_times, write_times = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        transactions = parse(txt)
+        parse_times.append(time.perf_counter() - start)
+    os.makedirs(directory)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        write(transactions, os.path.join(directory, 'statement'))
+        write_times.append(time.perf_counter() - start)
+    qif = {}
+    for fn in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, fn), 'rb') as f:
+            qif[fn] = f.read()
+    return transactions, qif, min(parse_times), min(write_times)
+
+
+def transaction_diff(expected, got):
+    """a description of the first difference between two canonical
+    transaction lists, or None"""
+    expected, got = expected.splitlines(), got.splitlines()
+    for i, (e, g) in enumerate(zip(expected, got)):
+        if e != g:
+            return f'transaction {i}:\n  expected: {e}\n  engine:   {g}'
+    if len(expected) != len(got):
+        return f'{len(got)} transactions, expected {len(expected)}'
+    return None
+
+
+def qif_diff(expected, got, context=10):
+    """the first lines of a diff of the QIF files, or None"""
+    if expected.keys() != got.keys():
+        return f'QIF files {sorted(got)}, expected {sorted(expected)}'
+    for fn in expected:
+        if expected[fn] != got[fn]:
+            diff = difflib.unified_diff(expected[fn].decode('utf-8').splitlines(),
+                                        got[fn].decode('utf-8').splitlines(),
+                                        'expected/' + fn, 'engine/' + fn, lineterm='')
+            return '\n'.join(list(diff)[:context])
+    return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("token_files", nargs='*', help="-debug.txt files of real statements")
+    parser.add_argument("--engine", action='append', choices=list(ENGINES),
+                        help="engines to check (default: all); may be repeated")
+    parser.add_argument("--seeds", type=int, default=5, help="synthetic single statements (default: 5)")
+    parser.add_argument("--scale", type=int, default=100, help="statements in the synthetic archive (default: 100; 0 for none)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None, help="processes for pages-pool (default: one per CPU)")
+    parser.add_argument("--update-golden", action='store_true',
+                        help="rewrite the golden files (the synthetic statements and the short archive) from the current engine, then check")
+    args = parser.parse_args()
+    parse_pages_pool.workers = args.workers
+
+    engines = args.engine or list(ENGINES)
+    failed = []
+    totals = collections.defaultdict(float)
+    with tempfile.TemporaryDirectory() as tmp:
+        for n, (name, txt) in enumerate(corpus(args.token_files, args.seeds, args.scale)):
+            current, current_qif, parse_s, write_s = run_engine(
+                ENGINES['current'], txt, os.path.join(tmp, str(n), 'current'), args.repeat)
+            current = canonical(current)
+            totals['current'] += parse_s + write_s
+            if args.update_golden and (name.startswith('synthetic-') or name == f'archive-{GOLDEN_SCALE}x'):
+                write_golden(name, current, current_qif)
+            golden = None if name in args.token_files else read_golden(name)
+            if golden is None:
+                expected, expected_qif = current, current_qif
+                against = 'no golden files; against the current engine'
+            else:
+                expected, expected_qif = golden
+                against = 'against ' + os.path.relpath(golden_dir(name))
+            print(f'{name}: {len(txt)} lines ({against})')
+            for engine in engines:
+                if engine == 'current':
+                    got, got_qif, e_parse_s, e_write_s = current, current_qif, parse_s, write_s
+                else:
+                    got, got_qif, e_parse_s, e_write_s = run_engine(
+                        ENGINES[engine], txt, os.path.join(tmp, str(n), engine), args.repeat)
+                    got = canonical(got)
+                    totals[engine] += e_parse_s + e_write_s
+                speedup = (parse_s + write_s) / (e_parse_s + e_write_s)
+                diff = transaction_diff(expected, got) or qif_diff(expected_qif, got_qif)
+                print(f'    {engine:<12} {e_parse_s * 1000:10.2f} ms parse {e_write_s * 1000:10.2f} ms QIF'
+                      f'  {speedup:6.2f}x  {"ok" if diff is None else "DIFFERS"}')
+                if diff is not None:
+                    print('        ' + diff.replace('\n', '\n        '))
+                    failed.append(f'{engine} on {name}')
+
+    print()
+    for engine in engines:
+        if engine != 'current':
+            print(f'{engine:<12} {totals["current"] / totals[engine]:6.2f}x the current engine overall')
+    if failed:
+        print('differs from what was expected:', '; '.join(failed))
+        sys.exit(1)
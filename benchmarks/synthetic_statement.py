@@ -0,0 +1,190 @@
+"""
+Make up a Betterment statement: the same headers and row layout as a
+real quarterly statement, with random (but repeatable) funds and
+amounts. Good for benchmarks; the numbers mean nothing.
+
+    python benchmarks/synthetic_statement.py out.pdf [--scale N]
+
+writes a PDF; with a .txt name you get the text instead, and with a
+.csv name, a Moneydance Extract Data export of the same holdings.
+"""
+
+import os
+import sys
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ticker_registry import ticker_to_name
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+GOALS = ['Build Wealth', 'World Cup 2026']
+
+ACTIVITIES = ['Dividend Reinvestment', 'Automatic Deposit', 'Advisory Fee',
+              'Rebalance', 'Tax Loss Harvesting']
+
+
+def money(x):
+    sign = '-' if x < 0 else ''
+    return f'{sign}${abs(x):,.2f}'
+
+
+def tickers(n=10):
+    """the first n tickers we know about, as the statement shows them"""
+    return [t.upper() for t in sorted(ticker_to_name)[:n]]
+
+
+def holdings(seed=0, goals=GOALS, n_tickers=10):
+    """{goal: {ticker: shares}} for the monthly overview tables"""
+    r = random.Random(seed)
+    return {goal: {ticker: r.randint(1, 10**6) / 1000
+                   for ticker in r.sample(tickers(n_tickers), min(6, n_tickers))}
+            for goal in goals}
+
+
+def statement_lines(seed=0, periods=3, year=2016, goals=GOALS, n_tickers=10,
+                    rows_per_activity=4):
+    """the lines of text of one statement, as pdftotext -layout gives them.
+
+    Each goal gets a monthly overview of its holdings, a dividend
+    payment detail section with three dividends per period, and an
+    activity detail section with every kind of activity in every
+    period, each touching rows_per_activity funds.
+    """
+    r = random.Random(seed)
+    funds = tickers(n_tickers)
+    rows_per_activity = min(rows_per_activity, len(funds))
+    lines = ['Betterment', f'Quarterly Statement    {year}', '',
+             f'Total    {money(r.randint(1, 10**8) / 100)}', '']
+    for goal, held in holdings(seed, goals, n_tickers).items():
+        lines += [goal,
+                  f'Goal Summary    Beginning Balance    {money(r.randint(1, 10**7) / 100)}',
+                  '',
+                  'Monthly Overview',
+                  'Type    Description                                  Ticker   Allocation   Beginning   Change   Price   Shares   Ending']
+        for i, (ticker, shares) in enumerate(held.items()):
+            price = r.randint(1000, 20000) / 100
+            lines.append(f'{"ETFs" if i == 0 else "":<6}  {ticker_to_name[ticker.lower()]:<50}  {ticker:<5}  '
+                         f'{r.randint(1, 99)}%   {money(price * shares * .95):>12}  {money(price * shares * .05):>10}  '
+                         f'{money(price):>9}  {shares:>10.3f}  {money(price * shares):>12}')
+        lines += [f'Total    {money(r.randint(1, 10**7) / 100)}',
+                  '',
+                  'Dividend Payment Detail',
+                  'Date           Fund    Description                          Amount']
+        for period in range(periods):
+            month = MONTHS[period % 12]
+            for ticker in r.sample(funds, min(3, len(funds))):
+                lines.append(f'{month} {r.randint(1, 28):>2} {year}    {ticker:<5}   '
+                             f'Synthetic {ticker} Index ETF    {money(r.randint(1, 9999) / 100):>12}')
+        lines += ['',
+                  'Quarterly Activity Detail',
+                  'Date           Transaction              Fund    Price      Shares     Value         Shares      Value']
+        for period in range(periods):
+            date = f'{MONTHS[period % 12]} {10 + period % 18:>2} {year}'
+            for activity in ACTIVITIES:
+                for i, ticker in enumerate(r.sample(funds, rows_per_activity)):
+                    price = r.randint(1000, 20000) / 100
+                    amount = r.randint(1, 500000) / 100
+                    if activity == 'Advisory Fee' or (activity != 'Automatic Deposit'
+                                                      and activity != 'Dividend Reinvestment'
+                                                      and r.random() < .5):
+                        amount = -amount
+                    row = (f'{ticker:<5}   {money(price):>9}   {amount / price:>9.3f}   '
+                           f'{money(amount):>11}   {r.randint(1, 10**5) / 1000:>9.3f}   '
+                           f'{money(r.randint(1, 10**7) / 100):>12}')
+                    if i == 0:
+                        lines.append(f'{date}    {activity:<23}  {row}')
+                    else:
+                        lines.append(f'{"":<15}    {"":<23}  {row}')
+            lines.append('')
+    lines += ['Smart Saver', 'Nothing to see here', '']
+    return lines
+
+
+def archive_lines(scale=1, **kwargs):
+    """`scale` statements one after another, like a multi-year export
+    run through pdftotext in one go"""
+    one = statement_lines(**kwargs)
+    return one * scale
+
+
+def tokenized(lines, lower=True):
+    """what parse_text wants: the non-blank lines, split on whitespace"""
+    if lower:
+        return [line.lower().split() for line in lines if line.strip()]
+    return [line.split() for line in lines if line.strip()]
+
+
+def write_moneydance_csv(fn, seed=0, goals=GOALS, n_tickers=10, scale=1):
+    """the holdings in statement_lines, as Moneydance's Extract Data
+    extension would export them; `scale` repeats the rows"""
+    import csv
+    with open(fn, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(['Symbol', 'Stock', 'Shares/Units', 'Accounts'])
+        for goal, held in list(holdings(seed, goals, n_tickers).items()) * scale:
+            for ticker, shares in held.items():
+                w.writerow([ticker, ticker_to_name[ticker.lower()], f'{shares:.3f}',
+                            f'Betterment {goal}'])
+
+
+def _pdf_string(s):
+    return '(' + s.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ')'
+
+
+def write_pdf(lines, fn, lines_per_page=60):
+    """write the lines as a bare-bones PDF in Courier, one text line per
+    line, so that text extraction has something realistic to chew on"""
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+    # objects 1-3 are the catalog, page tree and font; then a page
+    # object and a content stream for each page
+    objects = [None, None, b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>']
+    kids = []
+    for page in pages:
+        ops = ['BT', '/F1 8 Tf', '11 TL', '24 770 Td']
+        for line in page:
+            ops.append(f'{_pdf_string(line)} Tj T*')
+        ops.append('ET')
+        stream = '\n'.join(ops).encode('latin-1')
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> '
+                       f'/Contents {len(objects) + 2} 0 R >>'.encode('latin-1'))
+        kids.append(f'{len(objects)} 0 R')
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+    objects[0] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    objects[1] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(kids)} >>'.encode('latin-1')
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for num, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % num + obj + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        out += b'%010d 00000 n \n' % offset
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    with open(fn, 'wb') as f:
+        f.write(out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output", help="a .pdf, .txt or .csv file name")
+    parser.add_argument("--scale", type=int, default=1, help="how many statements to concatenate")
+    parser.add_argument("--periods", type=int, default=3)
+    parser.add_argument("--tickers", type=int, default=10, help="how many funds to draw from")
+    args = parser.parse_args()
+
+    if args.output.endswith('.csv'):
+        write_moneydance_csv(args.output, n_tickers=args.tickers, scale=args.scale)
+    else:
+        lines = archive_lines(args.scale, periods=args.periods, n_tickers=args.tickers)
+        if args.output.endswith('.pdf'):
+            write_pdf(lines, args.output)
+        else:
+            with open(args.output, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
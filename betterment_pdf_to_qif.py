@@ -6,81 +6,99 @@ https://github.com/dandrake/betterment-pdf-to-qif
 """
 
 import sys
-import subprocess
-import re
+import os
+import time
 import datetime
+import enum
 import collections
+import functools
+import dataclasses
+from decimal import Decimal, ROUND_HALF_UP
+
+# Only what converting one statement needs is imported up front; the
+# batch, watch, async, cache and index code import their modules (some
+# of them slow to import) when they're used, so a one-off conversion
+# from a shell script starts quickly. benchmarks/bench_import.py keeps
+# an eye on this.
+from pipeline_stats import PipelineStats, profiled
+from text_extraction import BACKENDS, extract_lines, pdftotext_lines_async
+from token_format import write_tokens, write_header, write_line
+from ticker_registry import ticker_to_name, resolver
+from statement_grammar import GRAMMAR
 
 DEBUG = False
 
+# Bump this whenever a change to the parsing code changes what
+# parse_text returns; cached results from older versions are then ignored.
+PARSER_VERSION = 5
+
 mon_to_num = {'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6, 'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12}
 
-months = mon_to_num.keys()
-
-ticker_to_name = {
-    'bnd': 'Vanguard US Total Bond Market ETF',
-    'bndx': 'Total International Bond ETF',
-    'iagg': 'iShares Core International Aggregate Bond',
-    'vbr': 'Vanguard Small-Cap Value ETF',
-    'vti': 'Vanguard Total Stock Market ETF',
-    'vtv': 'Vanguard Value ETF',
-    'lqd': 'iShares iBoxx $ Investment Grade Corporate Bond ETF',
-    'vea': 'FTSE Developed Markets ETF',
-    'vwo': 'Vanguard FTSE Emerging Markets ETF',
-    'mub': 'Municipal Bonds ETF',
-    'vwob': 'Vanguard Emerging Markets Government Bond ETF',
-    'voe': 'Vanguard Mid-Cap Value ETF',
-    'vtip': 'Vanguard Short-Term Inflation-Protected Securities ETF',
-    'shv': 'iShares Short Treasury Bond ETF',
-    'emb': 'Emerging Markets Bonds',
-    'iemg': 'iShares Core MSCI Emerging Markets ETF',
-    'vcit': 'Vanguard Intermediate-Term Corporate Bond ETF',
-    'tfi': 'SPDR Nuveen Barclays Municipal Bond ETF',
-    'schf': 'Schwab International Equity ETF',
-    'schb': 'Schwab U.S. Broad Market ETF',
-    'agg': 'iShares Core Total US Bond Market ETF',
-    'iws': 'iShares Russell Mid-Cap Value ETF',
-    'iwn': 'iShares Russell 2000 Value ETF',
-    'schv': 'Schwab US Large-Cap Value',
-    'schx': 'Schwab US Large-Cap ETF',
-    'itot': 'iShares Core S&P Total U.S. Stock Market ETF',
-    'iefa': 'iShares Core MSCI EAFE ETF',
-    'jpst': 'JPMorgan Ultra-Short Income ETF (Aggregate Bond)',
-    'gbil': 'Goldman Sachs TreasuryAccess 01 Year ETF',
-    'spyv': 'SPDR S&P 500 Value ETF',
-    'stip': 'iShares 0-5 Year TIPS Bond ETF',
-    'vo': 'Vanguard Mid-Cap Stock ETF',
-    'spdw': 'SPDW S&P Word ex-US ETF',
-    'splg': 'SPDR Portfolio S&P 500 ETF',
-    'spsm': 'SPDR Portfolio S&P 600 Small Cap ETF',
-}
-
-# New ticker here -- add it , then in Moneydance for the relevant account create
-# a new security. Set the "Security ID" and Security Name to the value
-# above; the QIFs we generate match on that name, not the ticker.
-
-def parse_dividend_payment(line):
+months = frozenset(mon_to_num)
+
+class TransactionKind(enum.Enum):
+    DIV_PAY = 'div pay'      # a dividend paid into the goal
+    DIV_BUY = 'div buy'      # buying with that dividend
+    BUY = 'buy'              # buying after a deposit, or to rebalance
+    SELL = 'sell'            # selling to rebalance
+    FEE_SELL = 'fee sell'    # selling shares to pay the advisory fee
+    FEE_PAY = 'fee pay'      # the advisory fee itself; see with_fee_payments
+    TLH = 'tlh'              # tax loss harvesting buy or sell
+
+@dataclasses.dataclass(slots=True)
+class Transaction:
+    """One transaction from the statement. Money and share values are
+    Decimals, parsed once from the statement text."""
+    kind: TransactionKind
+    goal: str = None
+    date: datetime.date = None
+    ticker: str = None
+    desc: str = None
+    share_price: Decimal = None
+    shares: Decimal = None
+    amount: Decimal = None
+    # what the statement says the number of shares was; see the README
+    reported_shares: Decimal = None
+
+SHARE_PLACES = Decimal('0.000001')
+
+def money(s):
+    """'-$1,234.56' -> Decimal('-1234.56')"""
+    return Decimal(s.replace('$', '').replace(',', ''))
+
+def note_unknown(unknown, ticker, description=''):
+    """record a ticker that isn't in the table in the dictionary
+    `unknown`, if we were given one, with the known fund its
+    description suggests; a row with a description beats one without"""
+    if unknown is not None and (description or ticker not in unknown):
+        unknown[ticker] = (resolver.suggest(description), description)
+
+def parse_dividend_payment(line, unknown=None):
     """
     we look for lines like
 
     ['May', '7', '2015', 'MUB', 'iShares', 'National', 'AMT-Free', 'Muni', 'Bond', 'ETF', '$0.05']
 
     date, fund, description, amount
+
+    A row for a fund that isn't in the ticker table is noted in
+    `unknown` and not parsed: a guess from its description could book
+    it under the wrong fund.
     """
     try:
-        ret = {'type': 'div pay'}
-        ret['date'] = datetime.date(month=mon_to_num[line[0]],
-                                    day=int(line[1]),
-                                    year=int(line[2]))
-        ret['ticker'] = line[3]
-        ret['desc'] = ' '.join(line[4:-1])
-        ret['amount'] = line[-1].lstrip('-$').replace(',', '')
-
-        # these are here to raise exceptions if something weird happens
-        ticker_to_name[ret['ticker']]
-        float(ret['amount'])
+        ret = Transaction(TransactionKind.DIV_PAY)
+        ret.date = datetime.date(month=mon_to_num[line[0]],
+                                 day=int(line[1]),
+                                 year=int(line[2]))
+        ret.ticker = line[3]
+        ret.desc = ' '.join(line[4:-1])
+        ret.amount = money(line[-1].lstrip('-$'))
     except:
         raise ValueError
+    # this is a dividend row, so an unknown fund is worth reporting
+    if resolver.resolve(ret.ticker) is None:
+        note_unknown(unknown, ret.ticker, ret.desc)
+        raise ValueError
     return ret
 
 def dateatstart(line):
@@ -90,11 +108,22 @@ def dateatstart(line):
 
 def tickerindex(line):
     for i, s in enumerate(line):
-        try:
-            _ = ticker_to_name[s]
+        if s in ticker_to_name:
+            return i
+    raise ValueError
+
+def unknown_tickerindex(line):
+    """where the ticker would be in an activity row whose fund isn't in
+    the table: the word before a price, a number of shares and an
+    amount. Raises ValueError if the line doesn't look like that."""
+    for i in range(len(line) - 3):
+        if line[i].isalpha() and line[i+1].startswith('$'):
+            try:
+                Decimal(line[i+2])
+                money(line[i+3])
+            except ArithmeticError:
+                continue
             return i
-        except KeyError:
-            pass
     raise ValueError
 
 def get_date(line):
@@ -107,7 +136,7 @@ def get_date(line):
                                  day=int(line[i+1]),
                                  year=int(line[i+2]))
 
-def parse_other_activity(line):
+def parse_other_activity(line, unknown=None):
     """tricky thing here is that you have two kinds of lines:
 
     ['Jul', '12', '2016', 'Dividend', 'Reinvestment', 'MUB', '$113.77', '0.150', '$17.02', '76.690', '$8,725.07']
@@ -116,205 +145,261 @@ def parse_other_activity(line):
 
     ['VTIP', '$49.54', '0.204', '$10.11', '33.659', '$1,667.46']
 
-    so we return a dictionary with the keys we can figure out and leave
-    it to the caller to track the necessary state.
+    so we return a Transaction with the fields we can figure out and
+    leave it to the caller to track the necessary state.
 
     Transaction types are "Dividend Reinvestment", "Automatic
     Deposit", "Advisory Fee", and "Rebalance". (Others I'll add later.)
 
-    Returns a dictionary with keys (a subset of!):
+    The Transaction has (a subset of!):
 
-    * date: datetime.date object
+    * date: datetime.date object; None on a continuation line
     * ticker: ticker symbol
     * share_price
     * shares
+    * reported_shares
     * amount
-    * type: right now, one of:
-        * div buy: buying after a dividend payment
-        * buy, sell: buying after a deposit, selling for rebalance
-        * fee sell: selling shares to pay advisory fee
-        * tlh: buys and sells for a tax loss harvest. Note that after the first
+    * kind: right now, one of:
+        * DIV_BUY: buying after a dividend payment
+        * BUY, SELL: buying after a deposit, selling for rebalance
+        * FEE_SELL: selling shares to pay advisory fee
+        * TLH: buys and sells for a tax loss harvest. Note that after the first
           transaction for a TLH, further ones will be marked as a regular buy or sell.
 
     We need different selling types; we gather up the "fee sell"s and
     create a fee payment transaction, but for rebalances, we do nothing
     since those will be, well, balanced by purchases.
 
-    Values except the date are all strings.
+    Activity rows don't describe the fund, so one that isn't in the
+    ticker table can't be parsed; it's noted in `unknown`.
     """
     try:
-        ret = {}
         i = tickerindex(line)
-
-        d = get_date(line)
-        if d:
-            ret['date'] = d
-
-        ret['ticker'] = line[i]
-
-        ret['share_price'] = line[i+1].lstrip('$').replace(',', '')
+    except ValueError:
+        i = unknown_tickerindex(line)
+        note_unknown(unknown, line[i])
+        raise
+    try:
         # QIF files don't include negative amounts; they list
         # everything as positive and use the transaction type to
         # figure out the rest. So if it's not already a "fee sell",
         # look for a minus sign to see if it should be a sell.
-        ret['amount'] = line[i+3].replace('$', '').replace(',', '')
+        amount = money(line[i+3])
 
         desc = ''.join(line)
         if 'reinvestment' in desc:
-            ret['type'] = 'div buy'
+            kind = TransactionKind.DIV_BUY
         elif 'deposit' in desc:
-            ret['type'] = 'buy'
+            kind = TransactionKind.BUY
         elif 'fee' in desc:
-            ret['type'] = 'fee sell'
+            kind = TransactionKind.FEE_SELL
         elif 'harvesting' in desc:
-            ret['type'] = 'tlh'
-        elif float(ret['amount']) > 0:
-            ret['type'] = 'buy'
+            kind = TransactionKind.TLH
+        elif amount > 0:
+            kind = TransactionKind.BUY
         else:
-            ret['type'] = 'sell'
+            kind = TransactionKind.SELL
+
+        ret = Transaction(kind,
+                          date=get_date(line),
+                          ticker=line[i],
+                          share_price=money(line[i+1]),
+                          amount=amount,
+                          reported_shares=Decimal(line[i+2]))
 
         # We calculate the number of shares on our own; see
         # discussion in the README.
-        ret['shares'] = '{:.6f}'.format(float(ret['amount']) /
-                                        float(ret['share_price']))
-        if abs(float(ret['shares']) - float(line[i+2])) >= .001:
-            print('wonky number of shares:')
-            print('PDF says', line[4])
-            print('transaction:', ret)
-
-        # check if ticker ok
-        ticker_to_name[ret['ticker']]
+        ret.shares = (ret.amount / ret.share_price).quantize(SHARE_PLACES, ROUND_HALF_UP)
+        # share_audit.py reports on these across a whole archive
+        if DEBUG and abs(ret.shares - ret.reported_shares) >= Decimal('0.001'):
+            print('wonky number of shares: PDF says', line[i+2], 'transaction:', ret)
 
         return ret
     except Exception as err:
         if DEBUG: print(err)
         raise ValueError
 
+class StatementParser:
+    """The section state machine behind parse_text: feed it the tokenized
+    lines of a statement one at a time and it hands back the transaction
+    on each line, if there is one. Keeping the state here, rather than in
+    locals of a loop, means the lines can come from anywhere -- a list, a
+    generator, a subprocess -- one at a time.
+
+    Which lines start goals and sections comes from a Grammar (see
+    statement_grammar.py); a section's row shape, which becomes
+    trans_type, picks the method that reads its rows.
+    """
+
+    def __init__(self, grammar=None):
+        self.grammar = GRAMMAR if grammar is None else grammar
+        self.row_parsers = {'dividend': self.dividend, 'other': self.other}
+        self.goal = None
+        self.trans_type = None
+        self.sub_trans_type = None
+        self.trans_date = None
+        # normally a continuation row with no date before it is dropped;
+        # page_parallel keeps them, since the date may be on an earlier page
+        self.keep_undated = False
+        self.linenum = -1
+        # lines in a dividend or activity section that weren't transactions
+        self.failures = collections.Counter()
+        # funds not in the ticker table: {ticker: (ticker matched by
+        # description or None, description)}
+        self.unknown = {}
+
+    def feed(self, line):
+        """process one line (a list of lowercase strings); return a
+        transaction dictionary or None"""
+        self.linenum += 1
+        trans = None
+        goal = self.grammar.match_goal(line)
+        if goal:
+            self.start_goal(goal)
+        elif goal is None:
+            self.goal = None
+            if DEBUG: print('done with goals line', self.linenum)
+        if self.goal is not None:
+            # A "fee sell" sub-type only ever survives until the next
+            # line; the old loop reset it here whenever DEBUG was off,
+            # and we keep that behavior regardless of DEBUG.
+            if self.sub_trans_type is TransactionKind.FEE_SELL:
+                self.sub_trans_type = None
+            row_parser = self.row_parsers.get(self.trans_type)
+            if row_parser is not None:
+                trans = row_parser(line)
+
+            shape = self.grammar.match_section(line)
+            if shape is not None:
+                self.trans_type = shape
+        return trans
+
+    def start_goal(self, goal):
+        self.goal = goal
+        self.trans_type = None
+        self.sub_trans_type = None
+        if DEBUG: print(goal, 'starts line', self.linenum)
+
+    def dividend(self, line):
+        try:
+            trans = parse_dividend_payment(line, self.unknown)
+        except ValueError:
+            self.failures['dividend'] += 1
+            return None
+        if DEBUG: print('dividend:', trans)
+        trans.goal = self.goal
+        return trans
+
+    def other(self, line):
+        try:
+            trans = parse_other_activity(line, self.unknown)
+        except ValueError:
+            self.failures['other'] += 1
+            return None
+        if trans.date is not None:
+            self.trans_date = trans.date
+        elif self.trans_date is not None:
+            trans.date = self.trans_date
+        elif not self.keep_undated:
+            # a continuation row with nothing to continue
+            return None
+        # the first advisory fee transaction gets correctly classified
+        # as "fee sell", but after that they're just "sell"; change the type
+        # appropriately
+        if trans.kind is TransactionKind.SELL and self.sub_trans_type is TransactionKind.FEE_SELL:
+            trans.kind = TransactionKind.FEE_SELL
+        # similar for TLH: first one is marked as 'tlh', further ones are buy or sell
+        elif self.sub_trans_type is TransactionKind.TLH:
+            # we'll handle whether it's a buy or sell later
+            trans.kind = TransactionKind.TLH
+            if DEBUG: print('resetting trans.kind')
+        else:
+            if DEBUG: print(f'now, {self.sub_trans_type=}; setting sub_trans_type to {trans.kind=}')
+            self.sub_trans_type = trans.kind
+
+        if DEBUG: print('other trans:', trans)
+        trans.goal = self.goal
+        return trans
+
+def iter_transactions(txt, parser=None):
+    """yield the transactions in an iterable of tokenized lines"""
+    if parser is None:
+        parser = StatementParser()
+    for line in txt:
+        trans = parser.feed(line)
+        if trans is not None:
+            yield trans
+
+def with_fee_payments(transactions):
+    """pass the transactions through, adding a FEE_PAY transaction for
+    each run of FEE_SELLs in a goal on a date.
+
+    As we would say in SQL,
+      SELECT goal, date, SUM(amount)
+      WHERE type = 'fee sell'
+      GROUP BY goal, date;
+    but since a goal's fee sells for a date all come together, we can
+    emit the total as soon as we see a transaction for another goal or
+    a fee sell on another date, and only ever hold one running total.
+    """
+    key = None
+    total = Decimal(0)
+    for trans in transactions:
+        if key is not None and (trans.goal != key[0] or
+                                (trans.kind is TransactionKind.FEE_SELL and trans.date != key[1])):
+            yield Transaction(TransactionKind.FEE_PAY, goal=key[0], date=key[1], amount=abs(total))
+            key = None
+        if trans.kind is TransactionKind.FEE_SELL:
+            if key is None:
+                key = (trans.goal, trans.date)
+                total = Decimal(0)
+            total += trans.amount
+        yield trans
+    if key is not None:
+        yield Transaction(TransactionKind.FEE_PAY, goal=key[0], date=key[1], amount=abs(total))
+
 def parse_text(txt):
     """parse the text we get from the statement PDF (as a list of list of
-    strings) and return a list of transactions -- dictionaries.
+    strings) and return a list of Transactions.
     """
-    goal = None
-    trans_type = None
-    sub_trans_type = None
-    transactions = []
-    for linenum, line in enumerate(txt):
-        if line[:2] == 'build wealth'.split():
-            goal = 'build wealth'
-            trans_type = None
-            sub_trans_type = None
-            if DEBUG: print('build wealth starts line', linenum)
-        elif line[:2] == 'safety net'.split():
-            goal = 'safety net'
-            trans_type = None
-            sub_trans_type = None
-            if DEBUG: print('safety net starts on', linenum)
-        elif line[:3] == 'world cup 2026'.split():
-            goal = 'world cup'
-            trans_type = None
-            sub_trans_type = None
-            if DEBUG: print('world cup starts on', linenum)
-        elif line[:2] == 'smart saver'.split():
-            goal = None
-            if DEBUG: print('done with goals line', linenum)
-        if goal is not None:
-            if sub_trans_type is not None:
-                if sub_trans_type == 'fee sell':
-                    if DEBUG: print(f'line 212, sub_trans_type is fee sell, not resetting')
-                    else:
-                        if DEBUG: print(f'line 214, {sub_trans_type=}, setting to None')
-
-                        sub_trans_type = None
-            if trans_type == 'dividend':
-                try:
-                    trans = parse_dividend_payment(line)
-                    if DEBUG: print('dividend:', trans)
-                    trans['goal'] = goal
-                    transactions.append(trans)
-                except ValueError:
-                    pass
-            elif trans_type == 'other':
-                try:
-                    trans = parse_other_activity(line)
-                    try:
-                        trans_date = trans['date']
-                    except KeyError:
-                        trans['date'] = trans_date
-                    try:
-                        # the first advisory fee transaction gets correctly classified
-                        # as "fee sell", but after that they're just "sell"; change the type
-                        # appropriately
-                        if trans['type'] == 'sell' and sub_trans_type == 'fee sell':
-                            trans['type'] = 'fee sell'
-                        # similar for TLH: first one is marked as 'tlh', further ones are buy or sell
-                        elif sub_trans_type == 'tlh':
-                            # we'll handle whether it's a buy or sell later
-                            trans['type'] = 'tlh'
-                            if DEBUG: print('resetting  trans[type]')
-                        else:
-                            if DEBUG: print(f'now, {sub_trans_type=}; setting sub_trans_type to {trans["type"]=}')
-                            sub_trans_type = trans['type']
-                    except KeyError:
-                        trans['type'] = sub_trans_type
-
-                    if DEBUG: print('other trans:', trans)
-                    trans['goal'] = goal
-                    transactions.append(trans)
-                except ValueError:
-                    pass
+    return list(with_fee_payments(iter_transactions(txt)))
 
-            # use substring / subset match instead of line = ['a', 'b', 'c'], since
-            # the exact contents of the line vary a bit
-            if 'dividend payment detail' in ' '.join(line):
-                trans_type = 'dividend'
-            elif 'quarterly activity detail' in ' '.join(line):
-                trans_type = 'other'
-            elif 'monthly activity detail' in ' '.join(line):
-                trans_type = 'other'
-            elif 'snapshot activity detail' in ' '.join(line):
-                trans_type = 'other'
-
-
-    # now we want, as we would say in SQL,
-    #   SELECT goal, date, SUM(amount)
-    #   WHERE type = 'fee sell'
-    #   GROUP BY date;
-    # and to add corresponding fee-transfer transactions
-    fees = collections.defaultdict(float)
-    for trans in [t for t in transactions if t['type'] == 'fee sell']:
-        fees[(trans['goal'], trans['date'])] += float(trans['amount'])
-    for goal, date in fees.keys():
-        transactions.append({'goal': goal,
-                             'date': date,
-                             'type': 'fee pay',
-                             'amount': abs(fees[(goal, date)])})
-    return transactions
+def statement_tokens(fn, backend='pdftotext'):
+    """yield the non-blank lines of the statement, split on whitespace"""
+    for line in extract_lines(fn, backend):
+        tokens = line.split()
+        if tokens:
+            yield tokens
+
+def lowercase(txt):
+    for line in txt:
+        yield [s.lower() for s in line]
 
 def fmt_date(t):
-    return t['date'].strftime('%m/%d/%Y')
+    return t.date.strftime('%m/%d/%Y')
 
-def set_memo(trans):
-    trans['memo'] = ''
+def fmt_num(x):
+    """QIF wants positive numbers, and no exponents"""
+    return f'{abs(x):f}'
 
-    if trans['type'] == 'div buy':
-        trans['memo'] = 'dividend reinvestment'
-    elif 'tlh' in trans['type']:
-        trans['memo'] = 'tax loss harvesting'
-    elif 'fee sell' in trans['type']:
-        trans['memo'] = 'advisory fee sell'
-    if DEBUG and 'sell' in trans['memo']: print('in set_memo, trans: ', trans)
+MEMOS = {TransactionKind.DIV_BUY: 'dividend reinvestment',
+         TransactionKind.TLH: 'tax loss harvesting',
+         TransactionKind.FEE_SELL: 'advisory fee sell'}
+# later: maybe do allocation change; rebalance; charitable gifts
 
-    # later: maybe do allocation change; rebalance; charitable gifts
+def memo(trans):
+    ret = MEMOS.get(trans.kind, '')
+    if DEBUG and 'sell' in ret: print('in memo, trans: ', trans)
+    return ret
 
-def create_qif(transactions, fn):
-    # the initial space below is necessary!
-    hdr = r""" !Account
+# the initial space below is necessary!
+QIF_HEADER = r""" !Account
 NBetterment {0}
 DBetterment {0}
 TInvst
 ^"""
 
-    buysell = r"""!Type:Invst
+QIF_BUYSELL = r"""!Type:Invst
 D{date}
 N{type}
 Y{security}
@@ -325,7 +410,7 @@ M{memo}
 O0.00
 ^"""
 
-    div = r"""!Type:Invst
+QIF_DIV = r"""!Type:Invst
 D{date}
 NDiv
 Y{security}
@@ -334,7 +419,7 @@ O0.00
 L[Investment:Dividends]
 ^"""
 
-    fee = r"""!Type:Invst
+QIF_FEE = r"""!Type:Invst
 D{date}
 NXOut
 PAdmin Fee
@@ -344,75 +429,510 @@ ${amount}
 O0.00
 ^"""
 
-    bw = [hdr.format('Build Wealth')]
-    wc = [hdr.format('World Cup')]
+# look the format methods up once, not once per transaction
+_fmt_header = QIF_HEADER.format
+_fmt_buysell = QIF_BUYSELL.format
+_fmt_div = QIF_DIV.format
+_fmt_fee = QIF_FEE.format
+
+def qif_record(trans):
+    """the QIF text for one transaction"""
+    if trans.kind is TransactionKind.DIV_PAY:
+        return _fmt_div(date=fmt_date(trans),
+                        security=ticker_to_name[trans.ticker],
+                        amount=fmt_num(trans.amount))
+    elif trans.kind is TransactionKind.FEE_PAY:
+        return _fmt_fee(date=fmt_date(trans),
+                        amount=fmt_num(trans.amount))
+
+    if trans.kind in (TransactionKind.BUY, TransactionKind.DIV_BUY):
+        action = 'Buy'
+    elif trans.kind in (TransactionKind.SELL, TransactionKind.FEE_SELL):
+        action = 'Sell'
+    elif trans.kind is TransactionKind.TLH:
+        if DEBUG: print('qif_record:', trans)
+        action = 'Sell' if trans.shares.is_signed() else 'Buy'
+    else:
+        print('weird, transaction not dividend, fee, buy, or sell:', trans)
+        raise ValueError
 
-    for trans in transactions:
-        if 'div pay' == trans['type']:
-            q = div.format(date=fmt_date(trans),
-                           security=ticker_to_name[trans['ticker']],
-                           amount=trans['amount'])
-        elif 'fee pay' == trans['type']:
-            q = fee.format(date=fmt_date(trans),
-                           amount=trans['amount'])
-        else:
-            if trans['type'] == 'tlh':
-                if DEBUG: print('create_qif:', trans)
-                if trans['shares'][0] == '-':
-                    trans['type'] = 'tlh sell'
-                else:
-                    trans['type'] = 'tlh buy'
-
-            if 'buy' in trans['type']:
-                action = 'Buy'
-            elif 'sell' in trans['type']:
-                action = 'Sell'
-            else:
-                print('weird, transaction not dividend, fee, buy, or sell:', trans)
-                raise ValueError
-
-            set_memo(trans)
-
-            q = buysell.format(date=fmt_date(trans),
-                               type=action,
-                               security=ticker_to_name[trans['ticker']],
-                               price=trans['share_price'],
-                               num_shares=trans['shares'].lstrip('-'),
-                               amount=trans['amount'].lstrip('-'),
-                               memo=trans['memo'])
-
-        if trans['goal'] == 'build wealth':
-            bw.append(q)
-        elif trans['goal'] == 'world cup':
-            wc.append(q)
+    return _fmt_buysell(date=fmt_date(trans),
+                        type=action,
+                        security=ticker_to_name[trans.ticker],
+                        price=trans.share_price,
+                        num_shares=fmt_num(trans.shares),
+                        amount=fmt_num(trans.amount),
+                        memo=memo(trans))
+
+class QifWriter:
+    """Writes transactions straight out to one QIF file per goal,
+    <fn>-<goal>.qif, opening a goal's file the first time one of its
+    transactions shows up. Use it as a context manager.
+
+    Each file is written under a temporary name and renamed into place
+    by close(), so nothing watching the directory ever sees half a QIF
+    file; if the block raises, the temporary files are removed and any
+    earlier QIF files are left alone.
+
+    With prune, close() also removes the file an earlier run left for
+    any of the grammar's goals that has no transactions this time, so a
+    goal's file always comes from the latest conversion."""
+
+    def __init__(self, fn, grammar=None, prune=True):
+        self.fn = fn
+        self.grammar = GRAMMAR if grammar is None else grammar
+        self.prune = prune
+        self.files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
         else:
-            print('transaction has no goal!', trans)
-            raise ValueError
+            self.discard()
 
-    with open(fn + '-build_wealth.qif', 'w') as bwf:
-        bwf.write('\n'.join(bw))
-    with open(fn + '-world_cup.qif', 'w') as wcf:
-        wcf.write('\n'.join(wc))
+    def filename(self, goal):
+        return f'{self.fn}-{goal.replace(" ", "_")}.qif'
 
+    def write(self, trans):
+        f = self.files.get(trans.goal)
+        if f is None:
+            f = self.open(trans)
+        f.write('\n')
+        f.write(qif_record(trans))
 
-def run(fn):
-    # we want a list of lines, each split on whitespace
-    txt = [line.decode('utf-8') for line in
-           subprocess.check_output(['pdftotext', '-nopgbrk', '-layout',
-                                    fn, '-']).splitlines()]
+    def open(self, trans):
+        if not trans.goal:
+            print('transaction has no goal!', trans)
+            raise ValueError
+        f = open(self.filename(trans.goal) + '.tmp', 'w', buffering=1 << 16)
+        f.write(_fmt_header(trans.goal.title()))
+        self.files[trans.goal] = f
+        return f
+
+    def close(self):
+        for goal, f in self.files.items():
+            f.close()
+            os.replace(f.name, self.filename(goal))
+        if self.prune:
+            for goal in set(self.grammar.goals.values()) - set(self.files) - {None}:
+                try:
+                    os.remove(self.filename(goal))
+                except FileNotFoundError:
+                    pass
+        self.files = {}
+
+    def discard(self):
+        for f in self.files.values():
+            f.close()
+            os.remove(f.name)
+        self.files = {}
+
+def create_qif(transactions, fn, grammar=None, prune=True):
+    """write the transactions to <fn>-build_wealth.qif and so on, one file
+    for each goal that has transactions (and, with prune, none for the
+    rest)"""
+    with QifWriter(fn, grammar, prune) as writer:
+        for trans in transactions:
+            writer.write(trans)
+
+
+def parser_version(grammar=None):
+    """PARSER_VERSION plus a digest of the ticker table, since adding a
+    ticker changes which rows we can parse, and of the grammar if it
+    isn't the built-in one"""
+    import hashlib
+    tickers = hashlib.sha256(repr(sorted(ticker_to_name.items())).encode('utf-8'))
+    ret = f'{PARSER_VERSION}-{tickers.hexdigest()[:16]}'
+    if grammar is not None and grammar.version() != GRAMMAR.version():
+        ret += '-' + hashlib.sha256(grammar.version().encode('utf-8')).hexdigest()[:16]
+    return ret
 
-    with open(fn + '-debug.txt', 'w') as f:
-        f.write('\n'.join([str(line.split()) for line in txt
-                           if not re.match(r'^\s*$', line)]))
+def run(fn, cache=None, backend='pdftotext', index=None, stats=None, grammar=None,
+        page_workers=None):
+    """convert one statement. `cache` is an optional StatementCache,
+    `backend` one of text_extraction.BACKENDS, and `index` an optional
+    ExportIndex: with one, only transactions we haven't exported before
+    are written, to new <name>-delta-<date>-<time>-<goal>.qif files each
+    time. Pass a PipelineStats as `stats` to find out where the time
+    went, and a statement_grammar.Grammar to parse with something other
+    than the built-in one. With `page_workers`, the pages are parsed in
+    that many worker processes (see page_parallel.py)."""
+    if stats is None:
+        _run(fn, cache, backend, index, PipelineStats(), grammar, page_workers)
+        return
+    start = time.perf_counter()
+    lines, transactions = stats.lines, sum(stats.transactions.values())
+    _run(fn, cache, backend, index, stats, grammar, page_workers)
+    stats.statements += 1
+    stats.per_statement[fn] = {'seconds': time.perf_counter() - start,
+                               'lines': stats.lines - lines,
+                               'transactions': sum(stats.transactions.values()) - transactions}
+
+def delta_name(fn):
+    """<name>-delta-<date>-<time>, a new name for each export, since the
+    index has marked what an earlier export's files hold as done and
+    they mustn't be overwritten"""
+    ret = prefix = f'{fn[:-4]}-delta-{time.strftime("%Y%m%d-%H%M%S")}'
+    directory = os.path.dirname(ret) or '.'
+    n = 1
+    while any(name.startswith(os.path.basename(ret) + '-') for name in os.listdir(directory)):
+        n += 1
+        ret = f'{prefix}-{n}'
+    return ret
 
-    create_qif(parse_text([line.lower().split() for line in txt
-                           if not re.match(r'^\s*$', line)]),
-               fn[:-4])
+def _run(fn, cache, backend, index, stats, grammar, page_workers=None):
+    key = None
+    if cache is not None or index is not None:
+        from statement_cache import file_digest
+        key = file_digest(fn, f'{parser_version(grammar)}-{backend}')
+    if index is not None and index.seen_statement(key):
+        if DEBUG: print(fn, 'already exported')
+        return
+    cached = None
+    if cache is not None:
+        with stats.stage('cache'):
+            cached = cache.get(key)
+
+    with open(fn + '-debug.txt', 'w', encoding='utf-8') as debug:
+        if cached is not None:
+            tokens, transactions = cached
+            with stats.stage('debug file'):
+                for _ in write_tokens(tokens, debug):
+                    pass
+        elif page_workers is not None:
+            # the whole statement at once, a page at a time
+            from page_parallel import statement_pages, parse_pages
+            with stats.stage('extract'):
+                pages = list(statement_pages(fn, backend))
+            tokens = [line for page in pages for line in page]
+            with stats.stage('debug file'):
+                for _ in write_tokens(tokens, debug):
+                    pass
+            with stats.stage('tokenize'):
+                pages = [list(lowercase(page)) for page in pages]
+                stats.lines += len(tokens)
+            with stats.stage('parse'):
+                transactions, failures, unknown = parse_pages(pages, page_workers, grammar)
+            if cache is not None:
+                with stats.stage('cache'):
+                    cache.put(key, tokens, transactions)
+        else:
+            # each stage pulls lines from the one before it, so nothing
+            # holds the whole statement unless we're filling the cache
+            tokens = stats.timed('extract', statement_tokens(fn, backend))
+            tokens = stats.timed('debug file', write_tokens(tokens, debug))
+            if cache is not None:
+                tokens = list(tokens)
+            txt = stats.timed('tokenize', stats.count_lines(lowercase(tokens)))
+            parser = StatementParser(grammar)
+            failures, unknown = parser.failures, parser.unknown
+            transactions = stats.timed('parse', iter_transactions(txt, parser))
+            transactions = stats.timed('fees', with_fee_payments(transactions))
+            if cache is not None:
+                transactions = list(transactions)
+                with stats.stage('cache'):
+                    cache.put(key, tokens, transactions)
+        transactions = stats.count_transactions(transactions)
+
+        if index is None:
+            with stats.stage('qif'):
+                create_qif(transactions, fn[:-4], grammar)
+        else:
+            try:
+                with stats.stage('index'):
+                    new = list(index.new_transactions(transactions, fn))
+                if new:
+                    with stats.stage('qif'):
+                        create_qif(new, delta_name(fn), grammar, prune=False)
+            except BaseException:
+                index.abandon_statement()
+                raise
+            index.finish_statement(key, fn, len(new))
+
+    if cached is None:
+        stats.parse_failures.update(failures)
+        stats.add_unknown_tickers(fn, unknown)
+
+def statement_paths(pattern):
+    """a directory means every PDF in it; anything else is a glob pattern"""
+    import glob
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.pdf')
+    return sorted(glob.glob(pattern))
+
+def _run_one(fn, cache_dir=None, cache_max_bytes=None, cache_max_age=None,
+             backend='pdftotext', index_path=None, profile_dir=None, grammar=None):
+    # runs in a worker process; hand back the error as a string so one
+    # bad statement doesn't take down the rest of the batch
+    from export_index import ExportIndex
+    from statement_cache import StatementCache
+    stats = PipelineStats()
+    try:
+        cache = None
+        if cache_dir is not None:
+            cache = StatementCache(cache_dir, cache_max_bytes, cache_max_age)
+        with profiled(profile_dir, fn):
+            if index_path is None:
+                run(fn, cache, backend, stats=stats, grammar=grammar)
+            else:
+                with ExportIndex(index_path) as index:
+                    run(fn, cache, backend, index, stats, grammar)
+    except Exception as err:
+        return fn, f'{type(err).__name__}: {err}', stats.as_dict()
+    return fn, None, stats.as_dict()
+
+def run_batch(pattern, workers=None, cache_dir=None, cache_max_bytes=None,
+              cache_max_age=None, backend='pdftotext', index_path=None,
+              stats=None, profile_dir=None, grammar=None):
+    """convert every statement matching `pattern` (a directory or a glob)
+    using a pool of `workers` processes (default: one per CPU). If
+    `cache_dir` is given, each worker uses a StatementCache there; if
+    `index_path` is, only new transactions are exported (see run). The
+    workers' numbers are added up in `stats`, if given, and with
+    `profile_dir` each statement gets a cProfile dump there.
+
+    Returns a dictionary mapping each statement that failed to its
+    error message. A worker process that dies fails the statements
+    being converted at the time, and the batch goes on without it.
+    """
+    import concurrent.futures
+    import concurrent.futures.process
+    errors = {}
+    paths = statement_paths(pattern)
+    convert = functools.partial(_run_one, cache_dir=cache_dir,
+                                cache_max_bytes=cache_max_bytes,
+                                cache_max_age=cache_max_age,
+                                backend=backend,
+                                index_path=index_path,
+                                profile_dir=profile_dir,
+                                grammar=grammar)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    waiting = list(reversed(paths))
+    running = {}
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    broken = False
+    try:
+        while waiting or running:
+            # only as many statements as workers are handed over at a
+            # time, so if a worker dies and takes the pool down with it,
+            # only the ones being converted just then fail; the rest go
+            # to a new pool
+            while waiting and not broken and len(running) < workers:
+                try:
+                    future = pool.submit(convert, waiting[-1])
+                except concurrent.futures.process.BrokenProcessPool:
+                    broken = True
+                    break
+                running[future] = waiting.pop()
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                fn = running.pop(future)
+                try:
+                    fn, err, worker_stats = future.result()
+                except concurrent.futures.process.BrokenProcessPool as died:
+                    broken = True
+                    err, worker_stats = f'{type(died).__name__}: {died}', None
+                if err is not None:
+                    print(f'{fn}: {err}', file=sys.stderr)
+                    errors[fn] = err
+                if stats is not None and worker_stats is not None:
+                    stats.merge(worker_stats)
+            if broken and not running:
+                pool.shutdown()
+                pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+                broken = False
+    finally:
+        pool.shutdown()
+    print(f'converted {len(paths) - len(errors)} of {len(paths)} statements',
+          file=sys.stderr)
+    return errors
+
+async def _convert_async(fn, semaphore, grammar):
+    # like run() with no cache or index, but pdftotext's output is
+    # parsed as it arrives, while other statements' pdftotext runs
+    stats = PipelineStats()
+    start = time.perf_counter()
+    try:
+        async with semaphore:
+            parser = StatementParser(grammar)
+            transactions = []
+            with open(fn + '-debug.txt', 'w', encoding='utf-8') as debug:
+                write_header(debug)
+                async for text in pdftotext_lines_async(fn):
+                    tokens = text.split()
+                    if not tokens:
+                        continue
+                    write_line(tokens, debug)
+                    stats.lines += 1
+                    trans = parser.feed([s.lower() for s in tokens])
+                    if trans is not None:
+                        transactions.append(trans)
+        create_qif(stats.count_transactions(with_fee_payments(transactions)), fn[:-4], grammar)
+    except Exception as err:
+        return fn, f'{type(err).__name__}: {err}', stats.as_dict()
+    stats.statements += 1
+    stats.parse_failures.update(parser.failures)
+    stats.add_unknown_tickers(fn, parser.unknown)
+    stats.per_statement[fn] = {'seconds': time.perf_counter() - start,
+                               'lines': stats.lines,
+                               'transactions': sum(stats.transactions.values())}
+    return fn, None, stats.as_dict()
+
+async def convert_many(paths, concurrency=4, grammar=None):
+    """convert the statements with at most `concurrency` pdftotext
+    processes running at once, in one process and thread: while one
+    statement's text is being parsed, the others' pdftotext runs keep
+    going. Returns a list of (fn, error or None, stats dictionary), in
+    the order the statements finished."""
+    import asyncio
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [asyncio.ensure_future(_convert_async(fn, semaphore, grammar)) for fn in paths]
+    return [await task for task in asyncio.as_completed(tasks)]
+
+def convert_many_sync(paths, concurrency=4, stats=None, grammar=None):
+    """convert_many from plain code; reports like run_batch does and
+    returns a dictionary of the statements that failed"""
+    import asyncio
+    errors = {}
+    results = asyncio.run(convert_many(paths, concurrency, grammar))
+    for fn, err, statement_stats in results:
+        if err is not None:
+            print(f'{fn}: {err}', file=sys.stderr)
+            errors[fn] = err
+        if stats is not None:
+            stats.merge(statement_stats)
+    print(f'converted {len(results) - len(errors)} of {len(results)} statements',
+          file=sys.stderr)
+    return errors
+
+def watch(directory, workers=None, cache_dir=None, cache_max_bytes=None,
+          cache_max_age=None, backend='pdftotext', index_path=None,
+          stats=None, profile_dir=None, settle=2.0, stop=None, grammar=None):
+    """convert each statement PDF that arrives in `directory`, with the
+    same options as run_batch, until interrupted (or `stop()` returns
+    true); see watch_folder.py"""
+    import watch_folder
+    convert = functools.partial(_run_one, cache_dir=cache_dir,
+                                cache_max_bytes=cache_max_bytes,
+                                cache_max_age=cache_max_age,
+                                backend=backend,
+                                index_path=index_path,
+                                profile_dir=profile_dir,
+                                grammar=grammar)
+
+    def on_result(result):
+        watch_folder.report(result)
+        if stats is not None and result[2] is not None:
+            stats.merge(result[2])
 
-if __name__ == '__main__':
     try:
-        run(sys.argv[1])
-    except IndexError:
+        watch_folder.watch(directory, convert, workers, settle, on_result=on_result, stop=stop)
+    except KeyboardInterrupt:
         pass
 
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert Betterment statement PDFs to QIF files")
+
+    parser.add_argument("statement", nargs='?', help="Betterment statement PDF")
+    parser.add_argument("--batch", metavar="DIR_OR_GLOB", help="Convert every statement PDF in a directory, or matching a glob pattern")
+    parser.add_argument("--watch", metavar="DIR", help="Keep running, converting each statement PDF that shows up in this directory")
+    parser.add_argument("--settle", type=float, default=2.0, help="With --watch, wait until a PDF hasn't changed for this many seconds (default: 2)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes for --batch or --watch (default: one per CPU)")
+    parser.add_argument("--page-workers", type=int, default=None, metavar="N", help="Parse the pages of a single statement in N worker processes; for very long statements")
+    parser.add_argument("--concurrency", type=int, default=None, metavar="N", help="Convert the --batch in this one process, running up to N pdftotext processes at once, instead of using worker processes")
+    parser.add_argument("--backend", choices=list(BACKENDS), default='pdftotext', help="How to extract text from the PDF (default: pdftotext)")
+    parser.add_argument("--cache-dir", help="Cache extracted text and parsed transactions here, keyed on the PDF contents")
+    parser.add_argument("--cache-max-mb", type=float, default=None, help="Trim the cache to this many megabytes")
+    parser.add_argument("--cache-max-days", type=float, default=None, help="Drop cache entries older than this many days")
+    parser.add_argument("--index", metavar="DB", help="Only export transactions not already recorded in this SQLite index, to -delta- QIF files")
+    parser.add_argument("--grammar", metavar="JSON", help="Read goal markers and section headers from this file instead of the built-in ones (see statement_grammar.py)")
+    parser.add_argument("--archive", metavar="FILE", help="Add each converted statement's text to this archive, indexed by goal and section (see statement_archive.py)")
+    parser.add_argument("--unknown-tickers", metavar="LOG", default='unknown-tickers.tsv', help="Add tickers that aren't in tickers.tsv to this log (default: unknown-tickers.tsv)")
+    parser.add_argument("--stats", metavar="JSON", help="Write per-stage timings and counts to this JSON file")
+    parser.add_argument("--profile", metavar="DIR", help="Write a cProfile dump for each statement to this directory")
+    args = parser.parse_args(argv)
+    if args.concurrency is not None and (args.batch is None or args.backend != 'pdftotext'
+                                         or args.cache_dir or args.index or args.profile):
+        parser.error("--concurrency only goes with --batch and the pdftotext backend, without --cache-dir, --index or --profile")
+    if args.page_workers is not None and (args.statement is None or args.batch or args.watch):
+        parser.error("--page-workers only goes with a single statement")
+    if args.archive is not None and args.watch is not None:
+        parser.error("--archive doesn't go with --watch; add the -debug.txt files with statement_archive.py")
+    if args.archive is not None and args.statement is None and args.batch is None:
+        parser.error("--archive needs a statement or --batch to add to it")
+
+    cache_max_bytes = None
+    if args.cache_max_mb is not None:
+        cache_max_bytes = int(args.cache_max_mb * 1024 * 1024)
+    cache_max_age = None
+    if args.cache_max_days is not None:
+        cache_max_age = args.cache_max_days * 24 * 60 * 60
+    stats = PipelineStats()
+    grammar = None
+    if args.grammar is not None:
+        from statement_grammar import Grammar
+        grammar = Grammar.load(args.grammar)
+
+    if args.watch is not None:
+        errors = None
+        watch(args.watch, args.workers, args.cache_dir, cache_max_bytes,
+              cache_max_age, args.backend, args.index, stats, args.profile,
+              args.settle, grammar=grammar)
+    elif args.concurrency is not None:
+        errors = convert_many_sync(statement_paths(args.batch), args.concurrency, stats, grammar)
+    elif args.batch is not None:
+        errors = run_batch(args.batch, args.workers, args.cache_dir,
+                           cache_max_bytes, cache_max_age, args.backend,
+                           args.index, stats, args.profile, grammar)
+    elif args.statement is not None:
+        errors = None
+        from export_index import ExportIndex
+        from statement_cache import StatementCache
+        cache = None
+        if args.cache_dir is not None:
+            cache = StatementCache(args.cache_dir, cache_max_bytes, cache_max_age)
+        with profiled(args.profile, args.statement):
+            if args.index is None:
+                run(args.statement, cache, args.backend, stats=stats, grammar=grammar,
+                    page_workers=args.page_workers)
+            else:
+                with ExportIndex(args.index) as index:
+                    run(args.statement, cache, args.backend, index, stats, grammar,
+                        args.page_workers)
+    else:
+        errors = None
+
+    if args.archive is not None:
+        from statement_archive import StatementArchive
+        from token_format import read_tokens
+        converted = [args.statement] if args.batch is None else statement_paths(args.batch)
+        converted = [fn for fn in converted if fn is not None]
+        with StatementArchive(args.archive, grammar) as archive:
+            for fn in converted:
+                # a statement the index skipped may have no token file
+                if fn not in (errors or {}) and os.path.exists(fn + '-debug.txt'):
+                    archive.add(fn, read_tokens(fn + '-debug.txt'))
+
+    if stats.unknown_tickers:
+        from ticker_registry import write_unknown_log
+        write_unknown_log(args.unknown_tickers, stats.unknown_tickers)
+        print(f"{len(stats.unknown_tickers)} tickers aren't in the ticker table; see {args.unknown_tickers}",
+              file=sys.stderr)
+    if args.stats is not None:
+        stats.write_json(args.stats)
+    if errors:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    # run the copy of this file that's imported as betterment_pdf_to_qif,
+    # not __main__, so the Transactions we pickle (for the cache and page
+    # workers) can be unpickled by anything else that imports us
+    import betterment_pdf_to_qif
+    betterment_pdf_to_qif.main()
+
 #  LocalWords:  spdw spdr splg
@@ -14,8 +14,13 @@ Then to get the totals from my statement, use this.
 
 import sys
 import csv
+import time
+import datetime
+import resource
+from decimal import Decimal
 from collections import defaultdict
-from betterment_pdf_to_qif import ticker_to_name
+from ticker_registry import ticker_to_name
+from token_format import read_tokens
 
 def normalized_key(goal_):
     goal = goal_.lower()
@@ -30,76 +35,129 @@ def normalized_key(goal_):
 
 
 class MoneydanceExtractDataParser:
+    """Reads the Extract Data CSV in a single streaming pass.
+
+    An export can have several sections separated by blank rows, each
+    starting with its own header row; we read every section that has
+    the Symbol, Stock, Shares/Units and Accounts columns (plus Date, if
+    there is one), keep only those columns, and parse the shares to
+    Decimal once.
+
+    self.snapshots maps each date (None for an undated export) to
+    holdings, {goal: {ticker: {'stock_name': ..., 'shares': Decimal}}};
+    self.holdings is the latest of those.
+    """
+
+    COLUMNS = ['Symbol', 'Stock', 'Shares/Units', 'Accounts']
+    DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y', '%Y%m%d']
+
     def __init__(self, csv_filename, debug=False):
         self.debug = debug
-        self.holdings = self.get_dict_from_rows(self.get_rows_from_csv(csv_filename))
-
-    def get_rows_from_csv(self, csv_filename):
-        rows = []
-        with open(csv_filename) as csv_file:
-            csv_reader = csv.reader(csv_file)
-            for row in csv_reader:
-                if row == ['']:
-                    return rows
-                rows.append(row)
-        return rows
-
-    def get_dict_from_rows(self, rows):
-        holdings = defaultdict(dict)
-        header = rows[0]
-        symbol_col = header.index('Symbol')
-        stock_name_col = header.index('Stock')
-        shares_col = header.index('Shares/Units')
-        account_col = header.index('Accounts')
-        for holding in rows[1:]:
-            if self.debug: print(f'{holding[symbol_col]}, {holding[stock_name_col]}, {holding[shares_col]}, {holding[account_col]}')
-            holdings[normalized_key(holding[account_col])][holding[symbol_col].lower()] = {'stock_name': holding[stock_name_col],
-                                                                   'shares': holding[shares_col]}
-        return holdings
+        self.rows = 0
+        self.seconds = 0.0
+        self.snapshots = defaultdict(lambda: defaultdict(dict))
+        self.read(csv_filename)
+        dates = [d for d in self.snapshots if d is not None]
+        if dates:
+            self.holdings = self.snapshots[max(dates)]
+        else:
+            self.holdings = self.snapshots[None]
+
+    def read(self, csv_filename):
+        start = time.perf_counter()
+        with open(csv_filename, newline='') as csv_file:
+            columns = None
+            for row in csv.reader(csv_file):
+                if not any(row):
+                    # blank row: the next one is a new section's header
+                    columns = None
+                    continue
+                if columns is None:
+                    columns = self.project(row)
+                    continue
+                if columns is False:
+                    # a section without holdings in it
+                    continue
+                self.rows += 1
+                self.add_row(row, *columns)
+        self.seconds = time.perf_counter() - start
+
+    def project(self, header):
+        """the indexes of the columns we want, or False if this section
+        doesn't have them"""
+        try:
+            columns = [header.index(name) for name in self.COLUMNS]
+        except ValueError:
+            if self.debug: print(f'skipping section with header {header}')
+            return False
+        columns.append(header.index('Date') if 'Date' in header else None)
+        return columns
+
+    def add_row(self, row, symbol_col, stock_name_col, shares_col, account_col, date_col):
+        if self.debug: print(f'{row[symbol_col]}, {row[stock_name_col]}, {row[shares_col]}, {row[account_col]}')
+        try:
+            goal = normalized_key(row[account_col])
+            shares = Decimal(row[shares_col].replace(',', ''))
+        except (ValueError, ArithmeticError):
+            # not a Betterment goal, or no share count (a cash line, say)
+            if self.debug: print(f'skipping row {row}')
+            return
+        date = None
+        if date_col is not None:
+            date = self.parse_date(row[date_col])
+        self.snapshots[date][goal][row[symbol_col].lower()] = {'stock_name': row[stock_name_col],
+                                                                'shares': shares}
+
+    def parse_date(self, s):
+        for fmt in self.DATE_FORMATS:
+            try:
+                return datetime.datetime.strptime(s, fmt).date()
+            except ValueError:
+                pass
+        raise ValueError(f"Cannot parse date '{s}'.")
+
+    def stats(self):
+        """rows read, rows per second, and the process's peak memory use"""
+        return {'rows': self.rows,
+                'seconds': self.seconds,
+                'rows_per_second': self.rows / self.seconds if self.seconds else None,
+                'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
 
 class BettermentStatementParser:
+    """Holdings from the "monthly overview" tables of a statement, read
+    from a token file (<pdf>-debug.txt) or handed over directly as the
+    statement's tokenized lines."""
 
-    def __init__(self, text_statement_file_name, debug=False):
+    def __init__(self, text_statement_file_name=None, debug=False, tokens=None):
         self.debug = debug
-        self.holdings = self.run(text_statement_file_name)
+        if tokens is None:
+            tokens = read_tokens(text_statement_file_name)
+        self.lines = self.normalize(tokens)
+        self.holdings = self.run(self.lines)
 
+    def normalize(self, tokens):
+        return [[s.replace(',', '').lower() for s in line] for line in tokens]
 
     def parse_file(self, fn):
-        ret = []
-        with open(fn) as f:
-            for line in f:
-                getpiece = lambda s: s.replace(',', '').lower()
-                ret.append([getpiece(_) for _ in eval(line)])
-
-        if self.debug:
-            print('=' * 80)
-            for i, line in enumerate(ret):
-                #print(f"{i=}, {line=}")
-                pass
-            print('=' * 80)
-        return ret
+        return self.normalize(read_tokens(fn))
 
-    def run(self, fn):
-        lines = self.parse_file(fn)
-        goal = None
-        in_monthly_overview = False
-        doing_holdings = False
-        did_parse_shares = False
-
-
-        for line in lines:
+    def dump_lines(self, out=sys.stdout):
+        """print each line as CSV with the last seven tokens in their own
+        columns, which lines up the holdings tables for a spreadsheet"""
+        for line in self.lines:
             reversed_line = list(reversed(line))
 
             output = (' '.join(reversed(reversed_line[7:]))
                       + ','
                       + ','.join(reversed(reversed_line[:7])))
 
-            print(output)
-
+            print(output, file=out)
 
-
-        if self.debug:
-            return {'fake_debugging_dict': 'definitely'}
+    def run(self, lines):
+        goal = None
+        in_monthly_overview = False
+        doing_holdings = False
+        did_parse_shares = False
 
         for i, line in enumerate(lines):
             if line[0] == 'total':
@@ -152,6 +210,63 @@ class BettermentStatementParser:
 
 
 
+def replay_archive(statements, opening=None, backend='pdftotext', debug=False, audit=None):
+    """check each statement's monthly overview against a HoldingsLedger
+    of the transactions in it and every statement before it.
+
+    statements are PDFs or token files, oldest first; opening, if given,
+    is one more statement whose holdings the ledger starts from. Each
+    statement is dated by its last transaction. Returns a
+    ReconciliationEngine ready to reconcile().
+
+    With audit, a file name, also write share_audit.py's report of
+    reported against computed shares, checked against the last
+    statement's balances."""
+    from betterment_pdf_to_qif import statement_tokens, lowercase, iter_transactions
+    from holdings_ledger import HoldingsLedger
+    start = None
+    if opening is not None:
+        start = statement_holdings_parser(opening, backend, debug).holdings
+    ledger = HoldingsLedger(opening=start)
+    engine = ReconciliationEngine(debug=debug, against='ledger')
+    periods = []
+    archive = []
+    for fn in statements:
+        tokens = list(statement_tokens(fn, backend) if fn.endswith('.pdf') else read_tokens(fn))
+        transactions = list(iter_transactions(lowercase(tokens)))
+        ledger.add(transactions)
+        if audit is not None:
+            archive += transactions
+        periods.append((ledger.last_date(), BettermentStatementParser(debug=debug, tokens=tokens).holdings))
+        if debug: print(f'{fn}: through {periods[-1][0]}')
+    # the ledger's balances are only built here, once, for every period
+    for date, holdings in periods:
+        engine.add_betterment(date, holdings)
+        engine.add_ledger(date, ledger.holdings(date))
+    if audit is not None:
+        from share_audit import ShareAudit
+        ShareAudit(archive).write_csv(audit, periods[-1][1] if periods else {}, start)
+    return engine
+
+
+def statement_holdings_parser(fn, backend='pdftotext', debug=False):
+    if fn.endswith('.pdf'):
+        from betterment_pdf_to_qif import statement_tokens
+        return BettermentStatementParser(debug=debug, tokens=statement_tokens(fn, backend))
+    return BettermentStatementParser(fn, debug)
+
+
+def statement_from_pdf(fn, backend='pdftotext', debug=False):
+    """Extract the statement's text once, write its QIF files just like
+    betterment_pdf_to_qif.run, and return a BettermentStatementParser
+    over the same tokens -- no -debug.txt file in between."""
+    from betterment_pdf_to_qif import (statement_tokens, lowercase, iter_transactions,
+                                       with_fee_payments, create_qif)
+    tokens = list(statement_tokens(fn, backend))
+    create_qif(with_fee_payments(iter_transactions(lowercase(tokens))), fn[:-4])
+    return BettermentStatementParser(debug=debug, tokens=tokens)
+
+
 class HoldingsComparer:
     def __init__(self, md, bment, debug=False):
         self.debug = debug
@@ -203,6 +318,91 @@ class ComparisonSorter:
         return ret
 
 
+class ReconciliationEngine:
+    """Reconcile Betterment statements against Moneydance snapshots for
+    any number of dates in one go.
+
+    Feed it holdings -- the {goal: {ticker: {'shares': ...}}}
+    dictionaries the parsers above produce -- with add_betterment and
+    add_moneydance, then call reconcile(). Everything is indexed by
+    (goal, ticker) and then date, so each holding's history is walked
+    once, in date order, and we can say how the difference drifted from
+    one period to the next and when it first appeared.
+
+    With against='ledger', the statements are checked against balances
+    replayed from their own transactions (see holdings_ledger.py),
+    added with add_ledger, instead of against Moneydance.
+    """
+
+    def __init__(self, tolerance=Decimal('0.001'), debug=False, against='moneydance'):
+        self.debug = debug
+        self.tolerance = tolerance
+        self.against = against
+        # (goal, ticker) -> date -> {'betterment': shares, against: shares}
+        self.index = defaultdict(lambda: defaultdict(dict))
+        self.dates = {'betterment': set(), against: set()}
+        self.stock_names = {}
+
+    def add(self, source, date, holdings):
+        self.dates[source].add(date)
+        for goal, goal_holdings in holdings.items():
+            for ticker, holding in goal_holdings.items():
+                self.index[(goal, ticker)][date][source] = Decimal(str(holding['shares']))
+                self.stock_names.setdefault(ticker, holding.get('stock_name', ''))
+
+    def add_betterment(self, date, holdings):
+        self.add('betterment', date, holdings)
+
+    def add_moneydance(self, date, holdings):
+        self.add('moneydance', date, holdings)
+
+    def add_ledger(self, date, holdings):
+        self.add('ledger', date, holdings)
+
+    def reconcile(self):
+        """yield a dictionary for every (goal, ticker, date) where we have
+        both a statement and a Moneydance snapshot (or ledger balance)
+        and either one holds the ticker, in goal, ticker, date order"""
+        periods = sorted(self.dates['betterment'] & self.dates[self.against])
+        for goal, ticker in sorted(self.index):
+            history = self.index[(goal, ticker)]
+            previous = None
+            first_discrepancy = None
+            for date in periods:
+                shares = history.get(date)
+                if shares is None:
+                    # held on neither side this period
+                    previous = Decimal(0)
+                    continue
+                md = shares.get(self.against, Decimal(0))
+                bment = shares.get('betterment', Decimal(0))
+                diff = md - bment
+                if first_discrepancy is None and abs(diff) >= self.tolerance:
+                    first_discrepancy = date
+                if self.debug: print(f'{goal=}, {ticker=}, {date=}, {md=}, {bment=}, {diff=}')
+                yield {'goal': goal,
+                       'ticker': ticker,
+                       'date': date,
+                       self.against: md,
+                       'betterment': bment,
+                       'diff': diff,
+                       'drift': None if previous is None else diff - previous,
+                       'first_discrepancy': first_discrepancy}
+                previous = diff
+
+    def rows(self):
+        """reconcile() as CSV rows, with a header"""
+        ret = [['Goal', 'Ticker', 'Date', f'{self.against.title()} Shares', 'Betterment_Shares',
+                'Difference', 'Drift', 'First Discrepancy', 'Stock Name']]
+        for r in self.reconcile():
+            ret.append([r['goal'], r['ticker'], r['date'].isoformat(),
+                        r[self.against], r['betterment'], r['diff'],
+                        '' if r['drift'] is None else r['drift'],
+                        '' if r['first_discrepancy'] is None else r['first_discrepancy'].isoformat(),
+                        ticker_to_name.get(r['ticker'], self.stock_names[r['ticker']])])
+        return ret
+
+
 class ComparisonWriter:
     def __init__(self, rows, output_filename):
         with open(output_filename, 'w') as outfile:
@@ -217,20 +417,68 @@ if __name__ == '__main__':
 
     parser.add_argument("--moneydance", help="CSV file of Moneydance account data from the Extract Data extension", required=False)
     parser.add_argument("--betterment", help="Text file of parsed Betterment statement data", required=False)
+    parser.add_argument("--archive", metavar="FILE", help="Read --betterment from this statement archive (see statement_archive.py) instead of a token file")
+    parser.add_argument("--pdf", help="Betterment statement PDF: extract its text once, write its QIF files, and read its holdings, all in one go")
+    parser.add_argument("--backend", default='pdftotext', help="Text extraction backend for --pdf (default: pdftotext)")
+    parser.add_argument("--dump-lines", action='store_true', help="Print the statement's lines as CSV, for pasting into a spreadsheet")
+    parser.add_argument("--period", nargs=3, action='append', metavar=("DATE", "BETTERMENT", "MONEYDANCE"),
+                        help="Statement date (YYYY-MM-DD), parsed statement text and Moneydance CSV for one period; repeat to reconcile many periods at once")
+    parser.add_argument("--ledger", nargs='+', metavar="STATEMENT",
+                        help="Statement PDFs or parsed statement text, oldest first: check each statement's holdings against the balances replayed from its transactions and all the earlier ones")
+    parser.add_argument("--opening", metavar="STATEMENT", help="With --ledger, the statement before the first one, whose holdings to start from")
+    parser.add_argument("--audit", metavar="CSV", help="With --ledger, also write a report of reported against computed shares per fund (needs numpy)")
     parser.add_argument("--output", default="holdings-compared.csv", help="Output file name")
     parser.add_argument("--debug", action='store_true')
+    parser.add_argument("--stats", action='store_true', help="Report rows/second and memory use for the Moneydance CSVs")
     args = parser.parse_args()
 
+    if args.ledger is not None:
+        engine = replay_archive(args.ledger, args.opening, args.backend, args.debug, args.audit)
+        ComparisonWriter(engine.rows(), args.output)
+        sys.exit(0)
+
+    if args.period is not None:
+        engine = ReconciliationEngine(debug=args.debug)
+        for date, betterment, moneydance in args.period:
+            date = datetime.date.fromisoformat(date)
+            engine.add_betterment(date, BettermentStatementParser(betterment).holdings)
+            md = MoneydanceExtractDataParser(moneydance, args.debug)
+            dates = sorted(d for d in md.snapshots if d is not None)
+            if date in md.snapshots:
+                engine.add_moneydance(date, md.snapshots[date])
+            elif not dates:
+                # an undated export is taken to be as of the statement
+                engine.add_moneydance(date, md.holdings)
+            else:
+                parser.error(f"{moneydance} has no snapshot dated {date}; its snapshots are "
+                             f"{', '.join(d.isoformat() for d in dates)}")
+            if args.stats: print(moneydance, md.stats(), file=sys.stderr)
+        ComparisonWriter(engine.rows(), args.output)
+        sys.exit(0)
+
     md_holdings = dict()
     if args.moneydance is not None:
-        md_holdings = MoneydanceExtractDataParser(args.moneydance, args.debug).holdings
+        md = MoneydanceExtractDataParser(args.moneydance, args.debug)
+        md_holdings = md.holdings
+        if args.stats: print(args.moneydance, md.stats(), file=sys.stderr)
+
+    bment = None
+    if args.pdf is not None:
+        bment = statement_from_pdf(args.pdf, args.backend, args.debug)
+    elif args.betterment is not None and args.archive is not None:
+        from statement_archive import StatementArchive
+        with StatementArchive(args.archive) as archive:
+            bment = BettermentStatementParser(debug=args.debug, tokens=archive.lines(args.betterment))
+    elif args.betterment is not None:
+        bment = BettermentStatementParser(args.betterment, args.debug)
 
     bment_holdings = dict()
-    if args.betterment is not None:
-        bment_holdings = BettermentStatementParser(args.betterment, args.debug).holdings
-
-
-    print(bment_holdings)
+    if bment is not None:
+        bment_holdings = bment.holdings
+        if args.dump_lines:
+            bment.dump_lines()
+        else:
+            print(bment_holdings)
 
     if len(md_holdings) > 0 and len(bment_holdings) > 0:
         comparer = HoldingsComparer(md_holdings, bment_holdings)
@@ -0,0 +1,88 @@
+"""
+A small SQLite database of the transactions we've already written to
+QIF files, so that re-running a growing pile of statements -- or
+monthly and quarterly statements that overlap -- only exports what's
+new.
+
+Transactions are identified by a fingerprint of goal, date, ticker,
+kind, amount and shares. Fee payments aren't recorded; each export's
+are added up from its new fee sells. Statements are identified by a
+digest of the PDF and the parser version; one we've already finished
+is skipped without even extracting its text.
+"""
+
+import sqlite3
+import datetime
+import collections
+
+
+class ExportIndex:
+    def __init__(self, path):
+        # batch workers each open their own connection; let them wait
+        # their turn for the write lock rather than fail
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS exported (
+                fingerprint TEXT PRIMARY KEY,
+                statement TEXT,
+                exported_at TEXT);
+            CREATE TABLE IF NOT EXISTS statements (
+                digest TEXT PRIMARY KEY,
+                filename TEXT,
+                new_transactions INTEGER,
+                finished_at TEXT);
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def seen_statement(self, digest):
+        cur = self.db.execute('SELECT 1 FROM statements WHERE digest = ?', (digest,))
+        return cur.fetchone() is not None
+
+    def new_transactions(self, transactions, fn):
+        """yield the transactions we haven't exported before, recording
+        them as we go, with fee payments for the new fee sells. Nothing
+        is saved until finish_statement."""
+        from betterment_pdf_to_qif import TransactionKind, with_fee_payments
+        # a fee payment is the total of the fee sells next to it, and a
+        # statement's total can include fee sells we've already
+        # exported (a row that didn't parse last time, say), so it's
+        # added up again from the new ones rather than looked up
+        rows = (t for t in transactions if t.kind is not TransactionKind.FEE_PAY)
+        return with_fee_payments(self._new_rows(rows, fn))
+
+    def _new_rows(self, transactions, fn):
+        # two identical rows in one statement are two transactions, so
+        # number the repeats; the same row in an overlapping statement
+        # gets the same number and is recognized as already exported
+        repeats = collections.Counter()
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        for trans in transactions:
+            fp = fingerprint(trans)
+            repeats[fp] += 1
+            cur = self.db.execute('INSERT OR IGNORE INTO exported VALUES (?, ?, ?)',
+                                  (f'{fp}|{repeats[fp]}', fn, now))
+            if cur.rowcount == 1:
+                yield trans
+
+    def finish_statement(self, digest, fn, count):
+        self.db.execute('INSERT OR REPLACE INTO statements VALUES (?, ?, ?, ?)',
+                        (digest, fn, count,
+                         datetime.datetime.now().isoformat(timespec='seconds')))
+        self.db.commit()
+
+    def abandon_statement(self):
+        self.db.rollback()
+
+
+def fingerprint(trans):
+    return '|'.join(['' if x is None else str(x) for x in
+                     (trans.goal, trans.date, trans.ticker, trans.kind.value,
+                      trans.amount, trans.shares)])
@@ -0,0 +1,109 @@
+"""
+What did each goal hold on a given date? HoldingsLedger replays the
+buys and sells that parse_text finds -- deposits, rebalances,
+dividend reinvestments, fee sells and tax loss harvests -- into a
+share balance over time for every (goal, ticker).
+
+Each balance is kept as a sorted list of dates alongside the running
+total of shares on those dates, so asking for a balance is a bisect,
+not a replay. Shares are the ones we compute ourselves (amount / price,
+to six places; see parse_other_activity), signed: sells are negative.
+
+holdings() gives the same {goal: {ticker: {'shares': ..., 'stock_name':
+...}}} dictionary that compare-holdings.py's parsers do, with goals
+named the same way ('buildwealth', 'worldcup', ...), so a ledger built
+from a whole archive of statements can be checked against each
+statement's monthly overview without Moneydance.
+"""
+
+import bisect
+import itertools
+from decimal import Decimal
+from collections import defaultdict
+
+from betterment_pdf_to_qif import TransactionKind
+from ticker_registry import ticker_to_name
+
+# the transactions that move shares in or out of a goal; dividend and
+# fee payments are cash
+SHARE_KINDS = frozenset([TransactionKind.BUY, TransactionKind.SELL,
+                         TransactionKind.DIV_BUY, TransactionKind.FEE_SELL,
+                         TransactionKind.TLH])
+
+
+def goal_key(goal):
+    """'world cup' -> 'worldcup', as compare-holdings names goals"""
+    return goal.replace(' ', '')
+
+
+class HoldingsLedger:
+    def __init__(self, transactions=(), opening=None):
+        """opening, if given, is a holdings dictionary of balances to
+        start from, as of before the first transaction"""
+        # (goal, ticker) -> [(date, shares), ...] in the order added
+        self.changes = defaultdict(list)
+        self.opening = defaultdict(Decimal)
+        if opening is not None:
+            for goal, goal_holdings in opening.items():
+                for ticker, holding in goal_holdings.items():
+                    self.opening[(goal_key(goal), ticker)] = Decimal(str(holding['shares']))
+        # (goal, ticker) -> (dates, running totals); rebuilt after add()
+        self.series = None
+        # the latest date of any change, kept up as they're added so
+        # asking for it doesn't need a rebuild
+        self.latest = None
+        self.add(transactions)
+
+    def add(self, transactions):
+        for trans in transactions:
+            if trans.kind in SHARE_KINDS:
+                self.changes[(goal_key(trans.goal), trans.ticker)].append((trans.date, trans.shares))
+                if self.latest is None or trans.date > self.latest:
+                    self.latest = trans.date
+        self.series = None
+
+    def build(self):
+        self.series = {}
+        for key in self.opening.keys() | self.changes.keys():
+            # sorted() is stable, so same-day transactions stay in
+            # statement order
+            changes = sorted(self.changes.get(key, ()), key=lambda change: change[0])
+            dates = [date for date, _ in changes]
+            totals = list(itertools.accumulate((shares for _, shares in changes),
+                                               initial=self.opening[key]))
+            self.series[key] = (dates, totals)
+
+    def shares(self, goal, ticker, date):
+        """the balance at the end of the day on date"""
+        if self.series is None:
+            self.build()
+        dates, totals = self.series.get((goal_key(goal), ticker), ((), [Decimal(0)]))
+        return totals[bisect.bisect_right(dates, date)]
+
+    def history(self, goal, ticker):
+        """yield (date, balance) after each transaction"""
+        if self.series is None:
+            self.build()
+        dates, totals = self.series.get((goal_key(goal), ticker), ((), ()))
+        yield from zip(dates, totals[1:])
+
+    def keys(self):
+        if self.series is None:
+            self.build()
+        return sorted(self.series)
+
+    def last_date(self):
+        return self.latest
+
+    def holdings(self, date):
+        """every nonzero balance at the end of date, as a holdings
+        dictionary"""
+        if self.series is None:
+            self.build()
+        ret = defaultdict(dict)
+        for (goal, ticker), (dates, totals) in self.series.items():
+            shares = totals[bisect.bisect_right(dates, date)]
+            if shares:
+                ret[goal][ticker] = {'shares': shares,
+                                     'stock_name': ticker_to_name.get(ticker, '')}
+        return ret
@@ -0,0 +1,175 @@
+"""
+Parse the pages of one big statement in parallel -- a multi-year
+export, say -- instead of one line after another.
+
+StatementParser's state at any line is the goal, the section
+(trans_type), the sub-type a row leaves behind for the rows after it,
+and the last date seen. Only the first two depend on lines far back,
+and they only change on goal and section headers, so a cheap first
+pass over the pages that does nothing but look for those headers
+(page_states) says what they are where each page starts. The pages are
+then split into runs of whole pages, and each run is parsed in a worker
+process by a StatementParser started from that state.
+
+The other two can't be known up front, so the workers leave them for
+the merge, which puts the runs back in order and fixes them up:
+
+* continuation rows at the top of a run, before its first date, are
+  kept undated (keep_undated) and get the last date of the runs before
+  them. If no run before had a date either, the serial parser would
+  have dropped them, so that run is parsed again with the real state.
+* a TLH sub-type lasts until the next goal, so if one is still in
+  force where a run starts, that run's activity rows up to its first
+  goal header become TLH rows, as they would have serially.
+
+Fee payments (with_fee_payments) are added once, after the merge. The
+transactions come out exactly as parse_text would give them.
+"""
+
+import os
+import collections
+import concurrent.futures
+
+from betterment_pdf_to_qif import StatementParser, TransactionKind, with_fee_payments
+from statement_grammar import GRAMMAR
+from text_extraction import extract_pages
+
+# the kinds a row of an 'other' section can come out as, i.e. the ones
+# a TLH sub-type turns into TLH
+ACTIVITY_KINDS = frozenset([TransactionKind.BUY, TransactionKind.SELL,
+                            TransactionKind.DIV_BUY, TransactionKind.FEE_SELL,
+                            TransactionKind.TLH])
+
+
+def statement_pages(fn, backend='pdftotext'):
+    """yield the non-blank lines of each page, split on whitespace, as
+    a list per page; like statement_tokens, but by page"""
+    for page in extract_pages(fn, backend):
+        yield [tokens for tokens in (line.split() for line in page) if tokens]
+
+
+def page_states(pages, grammar=None):
+    """[(goal, trans_type), ...]: the parser's goal and section where
+    each page starts. Looks at goal and section headers only, the same
+    way StatementParser.feed does."""
+    grammar = GRAMMAR if grammar is None else grammar
+    goal = trans_type = None
+    ret = []
+    for page in pages:
+        ret.append((goal, trans_type))
+        for line in page:
+            marker = grammar.match_goal(line)
+            if marker:
+                goal, trans_type = marker, None
+            elif marker is None:
+                goal = None
+            if goal is not None:
+                shape = grammar.match_section(line)
+                if shape is not None:
+                    trans_type = shape
+    return ret
+
+
+def page_runs(pages, runs):
+    """split range(len(pages)) into at most `runs` runs of whole pages,
+    each with about the same number of lines; [(start, end), ...]"""
+    total = sum(len(page) for page in pages)
+    ret = []
+    start = 0
+    count = 0
+    for i, page in enumerate(pages):
+        count += len(page)
+        if count * runs >= total * (len(ret) + 1) and i + 1 < len(pages):
+            ret.append((start, i + 1))
+            start = i + 1
+    ret.append((start, len(pages)))
+    return ret
+
+
+def parse_run(lines, goal, trans_type, grammar, sub_trans_type=None,
+              trans_date=None, keep_undated=True):
+    """parse one run of lines from the given state; runs in a worker.
+
+    Returns the transactions (without fee payments), how many of them
+    came before the run's first goal header (None if it has none), the
+    last date seen, whether a TLH sub-type is in force at the end, the
+    parse failures, and the unknown tickers."""
+    parser = StatementParser(grammar)
+    parser.goal = goal
+    parser.trans_type = trans_type
+    parser.sub_trans_type = sub_trans_type
+    parser.trans_date = trans_date
+    parser.keep_undated = keep_undated
+    transactions = []
+    first_goal = None
+    for line in lines:
+        if first_goal is None and grammar.match_goal(line):
+            first_goal = len(transactions)
+        trans = parser.feed(line)
+        if trans is not None:
+            transactions.append(trans)
+    return (transactions, first_goal, parser.trans_date,
+            parser.sub_trans_type is TransactionKind.TLH, parser.failures, parser.unknown)
+
+
+def parse_pages(pages, workers=None, grammar=None, runs=None):
+    """parse tokenized, lowercased pages with `workers` processes
+    (default: one per CPU) and return (transactions, failures, unknown
+    tickers), the transactions with fee payments added. The pages are split into
+    `runs` runs (default: two per worker); with one worker they're
+    parsed here, one run after another, which is slower than the serial
+    parser but exercises the same merge."""
+    grammar = GRAMMAR if grammar is None else grammar
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if runs is None:
+        runs = 2 * workers
+    pages = list(pages)
+    states = page_states(pages, grammar)
+    bounds = page_runs(pages, runs)
+    run_lines = [[line for page in pages[start:end] for line in page] for start, end in bounds]
+    goals = [states[start][0] for start, _ in bounds]
+    trans_types = [states[start][1] for start, _ in bounds]
+    grammars = [grammar] * len(bounds)
+
+    if workers == 1 or len(bounds) == 1:
+        results = map(parse_run, run_lines, goals, trans_types, grammars)
+        transactions, failures, unknown = merge(results, run_lines, goals, trans_types, grammar)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(parse_run, run_lines, goals, trans_types, grammars)
+            transactions, failures, unknown = merge(results, run_lines, goals, trans_types, grammar)
+    return list(with_fee_payments(transactions)), failures, unknown
+
+
+def merge(results, run_lines, goals, trans_types, grammar):
+    """put the runs' results back together in order, carrying the last
+    date and any TLH sub-type from each run into the next"""
+    transactions = []
+    failures = collections.Counter()
+    unknown = {}
+    trans_date = None
+    tlh = False
+    for i, result in enumerate(results):
+        trans, first_goal, last_date, ends_tlh, run_failures, run_unknown = result
+        if trans_date is None and any(t.date is None for t in trans):
+            # the serial parser drops continuation rows with no date
+            # before them, and the sub-types they'd have left behind
+            # with them; do exactly what it would have
+            sub = TransactionKind.TLH if tlh else None
+            trans, first_goal, last_date, ends_tlh, run_failures, run_unknown = parse_run(
+                run_lines[i], goals[i], trans_types[i], grammar, sub, None, False)
+        else:
+            before_goal = len(trans) if first_goal is None else first_goal
+            for n, t in enumerate(trans):
+                if t.date is None:
+                    t.date = trans_date
+                if tlh and n < before_goal and t.kind in ACTIVITY_KINDS:
+                    t.kind = TransactionKind.TLH
+        transactions.extend(trans)
+        failures.update(run_failures)
+        unknown.update(run_unknown)
+        if last_date is not None:
+            trans_date = last_date
+        tlh = ends_tlh or (tlh and first_goal is None)
+    return transactions, failures, unknown
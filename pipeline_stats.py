@@ -0,0 +1,129 @@
+"""
+Where does the time go when converting statements? PipelineStats
+records wall time per stage of the run() pipeline, how many lines went
+through it, how many transactions of each kind came out, how many
+lines the row parsers gave up on, and which statements mentioned funds
+missing from the ticker table. as_dict() gives a JSON-friendly
+report; several can be added up with merge().
+
+Since the stages are generators pulling from each other, a stage's time
+is only what it spends itself: time spent waiting on the stage before
+it is charged to that stage.
+"""
+
+import os
+import json
+import time
+import contextlib
+import collections
+
+
+class PipelineStats:
+    def __init__(self):
+        self.statements = 0
+        self.lines = 0
+        self.seconds = collections.defaultdict(float)
+        self.transactions = collections.Counter()
+        self.parse_failures = collections.Counter()
+        # {ticker: {'suggestion': ..., 'description': ..., 'statements': [...]}}
+        self.unknown_tickers = {}
+        self.per_statement = {}
+        # time spent in nested stages while the current one runs
+        self._inner = 0.0
+
+    def _enter(self):
+        saved = self._inner
+        self._inner = 0.0
+        return time.perf_counter(), saved
+
+    def _exit(self, stage, token):
+        start, saved = token
+        elapsed = time.perf_counter() - start
+        self.seconds[stage] += elapsed - self._inner
+        self._inner = saved + elapsed
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        token = self._enter()
+        try:
+            yield
+        finally:
+            self._exit(name, token)
+
+    def timed(self, name, iterable):
+        """pass the items of iterable through, charging the time it takes
+        to produce each one to the named stage"""
+        it = iter(iterable)
+        while True:
+            token = self._enter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self._exit(name, token)
+            yield item
+
+    def count_lines(self, txt):
+        for line in txt:
+            self.lines += 1
+            yield line
+
+    def count_transactions(self, transactions):
+        for trans in transactions:
+            self.transactions[trans.kind.value] += 1
+            yield trans
+
+    def add_unknown_tickers(self, fn, unknown):
+        """record StatementParser.unknown for statement fn"""
+        for ticker, (suggestion, description) in unknown.items():
+            entry = self.unknown_tickers.setdefault(
+                ticker, {'suggestion': suggestion, 'description': description, 'statements': []})
+            if fn not in entry['statements']:
+                entry['statements'].append(fn)
+
+    def as_dict(self):
+        return {'statements': self.statements,
+                'lines': self.lines,
+                'seconds': dict(self.seconds),
+                'transactions': dict(self.transactions),
+                'parse_failures': dict(self.parse_failures),
+                'unknown_tickers': self.unknown_tickers,
+                'per_statement': self.per_statement}
+
+    def merge(self, d):
+        """add in the numbers from another PipelineStats' as_dict()"""
+        self.statements += d['statements']
+        self.lines += d['lines']
+        for stage, seconds in d['seconds'].items():
+            self.seconds[stage] += seconds
+        self.transactions.update(d['transactions'])
+        self.parse_failures.update(d['parse_failures'])
+        for ticker, entry in d['unknown_tickers'].items():
+            for fn in entry['statements']:
+                self.add_unknown_tickers(fn, {ticker: (entry['suggestion'], entry['description'])})
+        self.per_statement.update(d['per_statement'])
+
+    def write_json(self, fn):
+        with open(fn, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+@contextlib.contextmanager
+def profiled(profile_dir, fn):
+    """run the body under cProfile and dump the results to
+    profile_dir/<statement file name>.prof; does nothing if profile_dir
+    is None"""
+    if profile_dir is None:
+        yield
+        return
+    import cProfile
+    os.makedirs(profile_dir, exist_ok=True)
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(os.path.join(profile_dir, os.path.basename(fn) + '.prof'))
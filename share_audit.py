@@ -0,0 +1,147 @@
+"""
+How far off are the share counts on the statements? Betterment reports
+shares to three places but keeps more (see "On rounding and number of
+shares" in the README), and we compute our own from amount / price to
+six. ShareAudit gathers both for every transaction in an archive and
+compares them all at once, in a TransactionTable:
+
+* per goal and fund: the reported and computed totals and how far they
+  have drifted apart;
+* outliers: single rows where the reported shares are further from
+  ours than rounding to three places can explain;
+* given statement balances (and opening balances), how far each of the
+  two totals is from what the statement says is actually held.
+
+    python share_audit.py statements/*.pdf --output audit.csv
+
+Needs numpy, as transaction_table does.
+"""
+
+import csv
+from decimal import Decimal
+
+import numpy as np
+
+from holdings_ledger import goal_key
+from transaction_table import TransactionTable, SHARE_KIND_CODES, MICROSHARES, _scaled, _decimal
+
+
+def _holdings_shares(holdings):
+    """{(goal, ticker): Decimal} from a holdings dictionary"""
+    if holdings is None:
+        return {}
+    return {(goal_key(goal), ticker): Decimal(str(holding['shares']))
+            for goal, goal_holdings in holdings.items()
+            for ticker, holding in goal_holdings.items()}
+
+
+class ShareAudit:
+    def __init__(self, transactions, tolerance=Decimal('0.001')):
+        if isinstance(transactions, TransactionTable):
+            self.table = transactions
+        else:
+            self.table = TransactionTable(transactions)
+        self.tolerance = tolerance
+        t = self.table
+        self.mask = np.isin(t.kind, SHARE_KIND_CODES)
+        # computed - reported for each row, in millionths of a share
+        self.diff = t.shares - t.reported_shares
+
+    def by_holding(self):
+        """yield a dictionary per goal and fund: how many transactions,
+        the reported and computed share totals, their difference, and
+        the largest single-row difference"""
+        t = self.table
+        keys = [t.goal, t.ticker]
+        groups, reported = t.group_sum(self.mask, keys, t.reported_shares)
+        _, computed = t.group_sum(self.mask, keys, t.shares)
+        _, counts = t.group_sum(self.mask, keys, np.ones(len(t), dtype=np.int64))
+        # the largest |difference| in each group: sort the rows by
+        # group, then by |difference|, and take each group's last row
+        inverse = np.unique(np.stack([t.goal[self.mask].astype(np.int64),
+                                      t.ticker[self.mask].astype(np.int64)], axis=1),
+                            axis=0, return_inverse=True)[1].ravel()
+        diff = self.diff[self.mask]
+        order = np.lexsort((np.abs(diff), inverse))
+        worst = diff[order][np.cumsum(counts) - 1]
+        for (goal, ticker), n, rep, comp, w in zip(groups, counts, reported, computed, worst):
+            yield {'goal': goal_key(t.goals[goal]),
+                   'ticker': t.tickers[ticker],
+                   'transactions': int(n),
+                   'reported': _decimal(rep, MICROSHARES),
+                   'computed': _decimal(comp, MICROSHARES),
+                   'drift': _decimal(comp - rep, MICROSHARES),
+                   'worst_row': _decimal(w, MICROSHARES)}
+
+    def outliers(self):
+        """yield (Transaction, difference) for the rows whose reported
+        shares are at least tolerance away from ours, worst first"""
+        rows = np.flatnonzero(self.mask & (np.abs(self.diff) >= _scaled(self.tolerance, MICROSHARES)))
+        for i in rows[np.argsort(-np.abs(self.diff[rows]), kind='stable')]:
+            yield self.table.transaction(i), _decimal(self.diff[i], MICROSHARES)
+
+    def against(self, balances, opening=None):
+        """by_holding(), plus how far the statement's balance is from the
+        opening balance plus each of the two totals. balances and
+        opening are holdings dictionaries (see compare-holdings.py)."""
+        balances = _holdings_shares(balances)
+        opening = _holdings_shares(opening)
+        seen = set()
+        for row in self.by_holding():
+            key = (row['goal'], row['ticker'])
+            seen.add(key)
+            start = opening.get(key, Decimal(0))
+            balance = balances.get(key, Decimal(0))
+            row['balance'] = balance
+            row['balance_vs_computed'] = balance - start - row['computed']
+            row['balance_vs_reported'] = balance - start - row['reported']
+            yield row
+        # held, but never traded in the archive
+        for key in sorted(balances.keys() - seen):
+            start = opening.get(key, Decimal(0))
+            yield {'goal': key[0], 'ticker': key[1], 'transactions': 0,
+                   'reported': Decimal(0), 'computed': Decimal(0), 'drift': Decimal(0),
+                   'worst_row': Decimal(0), 'balance': balances[key],
+                   'balance_vs_computed': balances[key] - start,
+                   'balance_vs_reported': balances[key] - start}
+
+    def write_csv(self, fn, balances=None, opening=None):
+        rows = self.by_holding() if balances is None else self.against(balances, opening)
+        header = ['Goal', 'Ticker', 'Transactions', 'Reported Shares', 'Computed Shares',
+                  'Drift', 'Worst Row']
+        if balances is not None:
+            header += ['Statement Balance', 'Balance - Computed', 'Balance - Reported']
+        with open(fn, 'w', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(header)
+            for row in sorted(rows, key=lambda row: (row['goal'], row['ticker'])):
+                out = [row['goal'], row['ticker'], row['transactions'], row['reported'],
+                       row['computed'], row['drift'], row['worst_row']]
+                if balances is not None:
+                    out += [row['balance'], row['balance_vs_computed'], row['balance_vs_reported']]
+                w.writerow(out)
+
+
+if __name__ == '__main__':
+    import argparse
+    from betterment_pdf_to_qif import statement_tokens, lowercase, iter_transactions
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("statements", nargs='+', help="statement PDFs")
+    parser.add_argument("--backend", default='pdftotext')
+    parser.add_argument("--output", default='share-audit.csv', help="per-fund report (default: share-audit.csv)")
+    parser.add_argument("--tolerance", type=Decimal, default=Decimal('0.001'),
+                        help="report rows whose shares are off by at least this much (default: 0.001)")
+    args = parser.parse_args()
+
+    def transactions():
+        for fn in args.statements:
+            yield from iter_transactions(lowercase(statement_tokens(fn, args.backend)))
+
+    audit = ShareAudit(transactions(), args.tolerance)
+    audit.write_csv(args.output)
+    outliers = list(audit.outliers())
+    print(f'{int(audit.mask.sum())} share transactions, {len(outliers)} off by at least {args.tolerance}')
+    for trans, diff in outliers:
+        print(f'  {trans.goal:<14} {trans.date} {trans.ticker:<6} {trans.kind.value:<9} '
+              f'reported {trans.reported_shares}, computed {trans.shares} ({diff:+})')
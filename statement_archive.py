@@ -0,0 +1,275 @@
+"""
+An archive of the tokenized text of every statement we've processed,
+with an index of where each goal and section starts, so one section of
+one old statement can be read -- and parsed -- without reading or
+parsing anything else.
+
+The archive is two files:
+
+* ARCHIVE: a header line like a token file's, then each statement's
+  lines, one JSON array per line (see token_format.py), one statement
+  after another. It's only ever appended to, and it's read through
+  mmap, so a reader only touches the pages it asks for.
+* ARCHIVE.index.json: for each statement, the byte range of its lines,
+  and a marker for each goal start and section header the grammar
+  finds, with the line number, byte offsets, and the parser's state
+  just after that line: goal, section, the sub-type a row left behind,
+  and the last date seen.
+
+A section is the lines from its header to the next marker. Parsing it
+starts a StatementParser from the state in its marker, so it finds
+exactly the transactions the whole-statement parse finds there.
+
+    python statement_archive.py add statements.archive s/*.pdf-debug.txt
+    python statement_archive.py list statements.archive
+    python statement_archive.py parse statements.archive 2016-q1.pdf --goal "build wealth"
+
+(betterment_pdf_to_qif.py --archive adds each statement it converts.)
+Adding a statement that's already there under the same name points
+the index at the new copy, unless the text is the same; the old lines
+stay in the file. The index is only written when the archive is
+closed, so use it as a context manager.
+"""
+
+import os
+import json
+import mmap
+import datetime
+import argparse
+
+from betterment_pdf_to_qif import (StatementParser, TransactionKind, lowercase,
+                                   with_fee_payments, parser_version)
+from statement_grammar import GRAMMAR
+from token_format import read_tokens
+
+FORMAT = 'betterment-token-archive'
+VERSION = 1
+HEADER = json.dumps({'format': FORMAT, 'version': VERSION})
+
+
+def line_offsets(data, start):
+    """the byte offset of each line in data, which starts at start"""
+    ret = []
+    for line in data.split(b'\n')[:-1]:
+        ret.append(start)
+        start += len(line) + 1
+    return ret
+
+
+def index_lines(tokens, grammar=None):
+    """the goal and section markers in a statement's tokenized lines"""
+    grammar = GRAMMAR if grammar is None else grammar
+    parser = StatementParser(grammar)
+    markers = []
+    for num, line in enumerate(lowercase(tokens)):
+        parser.feed(line)
+        goal = grammar.match_goal(line)
+        shape = grammar.match_section(line) if parser.goal is not None else None
+        if goal is False and shape is None:
+            continue
+        sub = parser.sub_trans_type
+        markers.append({'line': num,
+                        'kind': 'section' if goal is False else 'goal',
+                        'goal': parser.goal,
+                        'trans_type': parser.trans_type,
+                        'sub_trans_type': None if sub is None else sub.value,
+                        'trans_date': None if parser.trans_date is None else parser.trans_date.isoformat()})
+    return markers
+
+
+class StatementArchive:
+    def __init__(self, path, grammar=None):
+        self.path = path
+        self.index_path = path + '.index.json'
+        self.grammar = GRAMMAR if grammar is None else grammar
+        self.version = parser_version(grammar)
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding='utf-8') as f:
+                self.index = json.load(f)
+        # the index is written out once, by close(), not on every add
+        self.changed = False
+        self.file = None
+        self.map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.changed:
+            self._save_index()
+            self.changed = False
+        self._unmap()
+
+    def _unmap(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def names(self):
+        return list(self.index)
+
+    def _bytes(self, start, end):
+        """bytes start:end of the archive, through mmap"""
+        if self.map is None or len(self.map) < end:
+            self._unmap()
+            self.file = open(self.path, 'rb')
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map[start:end]
+
+    def _save_index(self):
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+
+    def add(self, name, tokens):
+        """append a statement's tokenized lines (as they are in its
+        token file, not lowercased) under name"""
+        tokens = list(tokens)
+        data = ''.join(json.dumps(line) + '\n' for line in tokens).encode('utf-8')
+        entry = self.index.get(name)
+        if entry is not None and entry['end'] - entry['start'] == len(data) \
+           and self._bytes(entry['start'], entry['end']) == data:
+            if entry['parser'] != self.version:
+                self.reindex(name)
+            return
+        with open(self.path, 'ab') as f:
+            if f.tell() == 0:
+                f.write(HEADER.encode('utf-8') + b'\n')
+            start = f.tell()
+            f.write(data)
+        self.index[name] = {'start': start, 'end': start + len(data), 'lines': len(tokens)}
+        self._mark(self.index[name], tokens, data)
+
+    def reindex(self, name):
+        """find the markers again, after a grammar or parser change"""
+        entry = self.index[name]
+        self._mark(entry, self.lines(name), self._bytes(entry['start'], entry['end']))
+
+    def _mark(self, entry, tokens, data):
+        markers = index_lines(tokens, self.grammar)
+        offsets = line_offsets(data, entry['start']) + [entry['end']]
+        for marker in markers:
+            # where the marker's line starts, and the line after it
+            marker['offset'] = offsets[marker['line']]
+            marker['body'] = offsets[marker['line'] + 1]
+        entry['markers'] = markers
+        entry['parser'] = self.version
+        self.changed = True
+
+    def entry(self, name):
+        try:
+            entry = self.index[name]
+        except KeyError:
+            raise KeyError(f'{name} is not in {self.path}') from None
+        if entry['parser'] != self.version:
+            self.reindex(name)
+        return entry
+
+    def markers(self, name, goal=None, trans_type=None):
+        """the markers in a statement, optionally only the sections of
+        one goal and of one row shape"""
+        ret = self.entry(name)['markers']
+        if goal is not None:
+            ret = [m for m in ret if m['goal'] == goal]
+        if trans_type is not None:
+            ret = [m for m in ret if m['trans_type'] == trans_type]
+        return ret
+
+    def lines(self, name, start=None, end=None):
+        """the tokenized lines of a statement, or the ones between two
+        byte offsets in it"""
+        entry = self.index[name]
+        start = entry['start'] if start is None else start
+        end = entry['end'] if end is None else end
+        return [json.loads(line) for line in self._bytes(start, end).decode('utf-8').splitlines()]
+
+    def section_range(self, name, marker):
+        """(start, end) byte offsets of the lines after marker, up to
+        the next marker or the end of the statement"""
+        entry = self.entry(name)
+        markers = entry['markers']
+        later = [m['offset'] for m in markers if m['line'] > marker['line']]
+        return marker['body'], later[0] if later else entry['end']
+
+    def parse_section(self, name, marker):
+        """the transactions in the section after marker (without fee
+        payments), parsed from the state the index recorded there"""
+        parser = StatementParser(self.grammar)
+        parser.goal = marker['goal']
+        parser.trans_type = marker['trans_type']
+        if marker['sub_trans_type'] is not None:
+            parser.sub_trans_type = TransactionKind(marker['sub_trans_type'])
+        if marker['trans_date'] is not None:
+            parser.trans_date = datetime.date.fromisoformat(marker['trans_date'])
+        parser.linenum = marker['line']
+        ret = []
+        for line in lowercase(self.lines(name, *self.section_range(name, marker))):
+            trans = parser.feed(line)
+            if trans is not None:
+                ret.append(trans)
+        return ret
+
+    def transactions(self, name, goal=None, trans_type=None):
+        """parse_text for just the sections of one goal (and row
+        shape), reading nothing else"""
+        wanted = [id(m) for m in self.markers(name, goal, trans_type)]
+        ret = []
+        block = []
+        for marker in self.markers(name):
+            # fee payments add up a goal's fee sells within one goal
+            # block, as they would between other goals' transactions
+            if marker['kind'] == 'goal':
+                ret += with_fee_payments(block)
+                block = []
+            if id(marker) in wanted and marker['trans_type'] is not None:
+                block += self.parse_section(name, marker)
+        return ret + list(with_fee_payments(block))
+
+
+def statement_name(fn):
+    """statement.pdf-debug.txt -> statement.pdf"""
+    return fn[:-len('-debug.txt')] if fn.endswith('-debug.txt') else fn
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Archive statements' text with an index of goals and sections")
+    parser.add_argument("command", choices=['add', 'list', 'show', 'parse'])
+    parser.add_argument("archive")
+    parser.add_argument("statements", nargs='*', help="add: token files (-debug.txt); show, parse: one statement name")
+    parser.add_argument("--goal", help="show, parse: only this goal")
+    parser.add_argument("--section", choices=['dividend', 'other'], help="show, parse: only this kind of section")
+    parser.add_argument("--grammar", metavar="JSON", help="Goal markers and section headers, as for betterment_pdf_to_qif.py")
+    args = parser.parse_args()
+
+    grammar = None
+    if args.grammar is not None:
+        from statement_grammar import Grammar
+        grammar = Grammar.load(args.grammar)
+    with StatementArchive(args.archive, grammar) as archive:
+        if args.command == 'add':
+            for fn in args.statements:
+                archive.add(statement_name(fn), read_tokens(fn))
+        elif args.command == 'list':
+            for name in archive.names():
+                markers = archive.markers(name)
+                goals = sorted({m['goal'] for m in markers if m['goal'] is not None})
+                print(f"{name}\t{archive.index[name]['lines']} lines\t{', '.join(goals)}")
+        elif len(args.statements) != 1:
+            parser.error(f'{args.command} takes one statement name')
+        elif args.command == 'show':
+            name = args.statements[0]
+            for marker in archive.markers(name, args.goal, args.section):
+                print(f"# line {marker['line']}: {marker['kind']} {marker['goal']} {marker['trans_type'] or ''}")
+                for line in archive.lines(name, *archive.section_range(name, marker)):
+                    print(' '.join(line))
+        else:
+            for trans in archive.transactions(args.statements[0], args.goal, args.section):
+                print(trans)
@@ -0,0 +1,100 @@
+"""
+On-disk cache of what we get out of a statement PDF: the tokens
+pdftotext gives us and the transactions parse_text finds in them.
+
+Entries are keyed on a hash of the PDF's contents plus the parser
+version, so rerunning a statement we've already seen skips both
+pdftotext and parsing, and a parser or ticker fix automatically
+invalidates everything.
+"""
+
+import os
+import time
+import pickle
+import hashlib
+
+
+def file_digest(fn, salt=''):
+    """sha256 of the salt and the file's contents, as hex"""
+    h = hashlib.sha256(str(salt).encode('utf-8'))
+    with open(fn, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class StatementCache:
+    def __init__(self, directory, max_bytes=None, max_age=None):
+        """max_bytes: total size to trim the cache down to after each write;
+        max_age: seconds after which an entry is thrown away. Either can
+        be None for no limit."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def get(self, key):
+        """return (tokens, transactions) for the key, or None on a miss"""
+        fn = self.path(key)
+        try:
+            with open(fn, 'rb') as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # truncated, or pickled by code that's since changed (or by
+            # a script run as __main__); a miss, and no use keeping
+            self._remove(fn)
+            return None
+        if self.max_age is not None and time.time() - os.path.getmtime(fn) > self.max_age:
+            self._remove(fn)
+            return None
+        return entry['tokens'], entry['transactions']
+
+    def put(self, key, tokens, transactions):
+        fn = self.path(key)
+        # write somewhere else first so a concurrent reader (say, another
+        # batch worker) never sees half an entry
+        tmp = f'{fn}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump({'tokens': tokens, 'transactions': transactions}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, fn)
+        self.evict()
+
+    def evict(self):
+        """drop entries older than max_age, then the oldest entries until
+        we're under max_bytes"""
+        if self.max_bytes is None and self.max_age is None:
+            return
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.pickle'):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            if self.max_age is not None and now - st.st_mtime > self.max_age:
+                self._remove(entry.path)
+            else:
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        if self.max_bytes is None:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, fn in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(fn)
+            total -= size
+
+    def _remove(self, fn):
+        try:
+            os.remove(fn)
+        except FileNotFoundError:
+            # someone else got there first
+            pass
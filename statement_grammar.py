@@ -0,0 +1,129 @@
+"""
+What a statement looks like, as data: the lines that start a goal (or
+an account), the headers that start each kind of section, and which
+row parser reads the rows of each section. StatementParser works from
+a compiled Grammar, so a new goal, an IRA, or a differently worded
+header is a change here -- or in a JSON file passed with --grammar --
+not in the parser.
+
+    python statement_grammar.py > my-grammar.json
+
+writes the built-in grammar out as a starting point. The file has:
+
+* "goals": each line that starts a goal, as it reads lowercased, and
+  the goal's name (used in the QIF file name). A name of null marks
+  the end of the goals we convert ("smart saver" on Betterment's
+  statements).
+* "sections": each section header and the row shape of its rows, one
+  of ROW_SHAPES: "dividend" (dividend payment rows) or "other"
+  (activity rows: deposits, fees, rebalances and so on).
+
+Goal markers have to start a line, as whole words. A section header
+can be anywhere in a line, even as part of longer words, since the
+exact wording varies a bit: "monthly activity details" and "dividend
+payment detail:" start sections too. If one line has several headers,
+the first one listed wins. Goals are found with dictionary lookups on
+the line's tokens and sections with one regular expression, so the
+cost per line doesn't grow much with the number of goals or headers.
+"""
+
+import re
+import sys
+import json
+
+ROW_SHAPES = ('dividend', 'other')
+
+DEFAULT = {
+    'goals': {
+        'build wealth': 'build wealth',
+        'safety net': 'safety net',
+        'world cup 2026': 'world cup',
+        # comes after the goals we care about
+        'smart saver': None,
+    },
+    'sections': {
+        'dividend payment detail': 'dividend',
+        'quarterly activity detail': 'other',
+        'monthly activity detail': 'other',
+        'snapshot activity detail': 'other',
+    },
+}
+
+
+def _words(phrase):
+    return ' '.join(phrase.lower().split())
+
+
+def _index(phrases):
+    """[(length, {tokens: value}), ...], longest markers first, and the
+    set of tokens any marker starts with"""
+    by_length = {}
+    for phrase, value in phrases.items():
+        tokens = tuple(phrase.lower().split())
+        if not tokens:
+            raise ValueError('empty marker in grammar')
+        by_length.setdefault(len(tokens), {})[tokens] = value
+    starts = frozenset(tokens[0] for markers in by_length.values() for tokens in markers)
+    return sorted(by_length.items(), reverse=True), starts
+
+
+class Grammar:
+    def __init__(self, goals, sections):
+        for header, shape in sections.items():
+            if shape not in ROW_SHAPES:
+                raise ValueError(f"section '{header}' has unknown row shape {shape!r}; "
+                                 f"choose from {', '.join(ROW_SHAPES)}")
+        self.goals = dict(goals)
+        self.sections = dict(sections)
+        # a line is looked up once for each distinct marker length, not
+        # once per marker; most lines are ruled out by their first
+        # token (goals) or one set operation (sections) before that
+        self.goal_markers, self.goal_starts = _index(self.goals)
+        # sections are a substring match on the line's words joined up
+        # again; most lines fail the one search, and a line that has a
+        # header is checked against each in turn for the first listed
+        self.section_headers = [(_words(header), shape) for header, shape in self.sections.items()]
+        if not all(header for header, _ in self.section_headers):
+            raise ValueError('empty marker in grammar')
+        self.section_pattern = re.compile('|'.join(re.escape(header) for header, _ in self.section_headers))
+
+    @classmethod
+    def load(cls, fn):
+        with open(fn, encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(config['goals'], config['sections'])
+
+    def as_dict(self):
+        return {'goals': self.goals, 'sections': self.sections}
+
+    def version(self):
+        """changes whenever the grammar does; part of the cache key"""
+        return json.dumps(self.as_dict(), sort_keys=True)
+
+    def match_goal(self, line):
+        """the name of the goal that line starts; None if it's a marker
+        that ends the goals; False if it's not a goal marker at all"""
+        if line and line[0] in self.goal_starts:
+            for length, markers in self.goal_markers:
+                key = tuple(line[:length])
+                if key in markers:
+                    return markers[key]
+        return False
+
+    def match_section(self, line):
+        """the row shape of the section whose header is in line, or None"""
+        text = ' '.join(line)
+        if not self.section_headers or self.section_pattern.search(text) is None:
+            return None
+        for header, shape in self.section_headers:
+            if header in text:
+                return shape
+        return None
+
+
+GRAMMAR = Grammar(DEFAULT['goals'], DEFAULT['sections'])
+
+
+if __name__ == '__main__':
+    json.dump(DEFAULT, sys.stdout, indent=2)
+    sys.stdout.write('\n')
@@ -0,0 +1,74 @@
+import os
+import sys
+import datetime
+import collections
+from decimal import Decimal
+
+import betterment_pdf_to_qif as b
+from export_index import ExportIndex
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from synthetic_statement import statement_lines, tokenized
+
+JAN_10 = datetime.date(2016, 1, 10)
+
+
+def fee_sell(ticker, amount='-1.00'):
+    return b.Transaction(b.TransactionKind.FEE_SELL, goal='build wealth', date=JAN_10,
+                         ticker=ticker, share_price=Decimal('10.00'),
+                         shares=Decimal(amount) / 10, amount=Decimal(amount))
+
+
+def export(index, transactions, digest):
+    new = list(index.new_transactions(b.with_fee_payments(transactions), digest))
+    index.finish_statement(digest, digest, len(new))
+    return new
+
+
+def fee_paid(transactions):
+    return sum(t.amount for t in transactions if t.kind is b.TransactionKind.FEE_PAY)
+
+
+def test_fee_paid_once_when_more_fee_sells_parse(tmp_path):
+    with ExportIndex(str(tmp_path / 'index.db')) as index:
+        # the first time, the bnd row didn't parse
+        first = export(index, [fee_sell('vti')], 'run 1')
+        second = export(index, [fee_sell('vti'), fee_sell('bnd')], 'run 2')
+    assert fee_paid(first) == Decimal('1.00')
+    assert fee_paid(second) == Decimal('1.00')
+    assert [t.ticker for t in second if t.kind is b.TransactionKind.FEE_SELL] == ['bnd']
+
+
+def test_nothing_new_pays_no_fee(tmp_path):
+    with ExportIndex(str(tmp_path / 'index.db')) as index:
+        export(index, [fee_sell('vti'), fee_sell('bnd')], 'run 1')
+        assert export(index, [fee_sell('vti'), fee_sell('bnd')], 'run 2') == []
+
+
+def test_each_export_gets_its_own_delta_files(tmp_path):
+    fn = str(tmp_path / 'statement.pdf')
+    first = b.delta_name(fn)
+    b.create_qif(b.with_fee_payments([fee_sell('vti')]), first, prune=False)
+    second = b.delta_name(fn)
+    assert second != first
+    b.create_qif(b.with_fee_payments([fee_sell('bnd')]), second, prune=False)
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_overlapping_statements_export_each_transaction_once(tmp_path):
+    quarter = b.parse_text(tokenized(statement_lines(seed=3)))
+    rows = [t for t in quarter if t.kind is not b.TransactionKind.FEE_PAY]
+    months = sorted({t.date.month for t in rows})
+    # monthly statements first, then a quarterly one that repeats them
+    # and the month after, then the quarterly one again
+    statements = [[t for t in rows if t.date.month == month] for month in months[:-1]]
+    statements += [rows, rows]
+    exported = []
+    with ExportIndex(str(tmp_path / 'index.db')) as index:
+        for n, transactions in enumerate(statements):
+            exported += export(index, transactions, f'statement {n}')
+
+    def counts(transactions):
+        return collections.Counter(repr(t) for t in transactions if t.kind is not b.TransactionKind.FEE_PAY)
+    assert counts(exported) == counts(rows)
+    assert fee_paid(exported) == fee_paid(quarter)
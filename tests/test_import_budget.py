@@ -0,0 +1,44 @@
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import bench_import
+
+
+@pytest.fixture(scope='module')
+def cached_env(tmp_path_factory):
+    """an environment whose .pyc files go to a temporary directory
+    rather than the source tree, and have been written there once"""
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=str(tmp_path_factory.mktemp('pycache')))
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    for cmd, _, _ in bench_import.TARGETS.values():
+        bench_import.importtime(cmd, env)
+    return env
+
+
+# wall-clock times vary too much on a busy machine to fail the suite
+# on; benchmarks/bench_import.py --check is the usual way to check them
+@pytest.mark.skipif(not os.environ.get('CHECK_IMPORT_BUDGET'),
+                    reason='timing check; set CHECK_IMPORT_BUDGET=1 to run it')
+@pytest.mark.parametrize('target', list(bench_import.TARGETS))
+def test_import_budget(target, cached_env):
+    cmd, budget, _ = bench_import.TARGETS[target]
+    startup = set(bench_import.top_level(bench_import.importtime(['-c', 'pass'], cached_env)))
+    # the best of a few runs, as bench_import.py --check takes
+    best = min(bench_import.cost(cmd, startup, cached_env)[0] for _ in range(3))
+    assert best <= budget, f'{target} imports take {best:.1f} ms, budget {budget} ms'
+
+
+def test_plain_import_stays_lazy():
+    proc = subprocess.run([sys.executable, '-c',
+                           'import sys, json, betterment_pdf_to_qif; print(json.dumps(sorted(sys.modules)))'],
+                          cwd=ROOT, stdout=subprocess.PIPE, text=True, check=True)
+    modules = set(json.loads(proc.stdout))
+    for module in ['asyncio', 'sqlite3', 'numpy'] + bench_import.LAZY:
+        assert module not in modules, f'import betterment_pdf_to_qif loads {module}'
@@ -0,0 +1,37 @@
+import os
+import sys
+import random
+
+import pytest
+
+import betterment_pdf_to_qif as b
+import page_parallel
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from synthetic_statement import statement_lines, archive_lines, tokenized
+
+
+def random_pages(txt, rng):
+    """txt cut into pages at random, some as short as one line"""
+    cuts = sorted(rng.sample(range(1, len(txt)), rng.randint(1, len(txt) // 3)))
+    return [txt[start:end] for start, end in zip([0] + cuts, cuts + [len(txt)])]
+
+
+STATEMENTS = [('synthetic-%d' % seed, tokenized(statement_lines(seed=seed))) for seed in range(3)]
+STATEMENTS.append(('archive-3x', tokenized(archive_lines(3))))
+
+
+@pytest.mark.parametrize('name, txt', STATEMENTS, ids=[name for name, _ in STATEMENTS])
+@pytest.mark.parametrize('cut', range(10))
+def test_random_pages_parse_as_one(name, txt, cut):
+    rng = random.Random(f'{name}-{cut}')
+    pages = random_pages(txt, rng)
+    transactions, _, _ = page_parallel.parse_pages(pages, 1, runs=rng.randint(2, len(pages)))
+    assert transactions == b.parse_text(txt)
+
+
+def test_pool_matches_serial():
+    txt = tokenized(archive_lines(3))
+    pages = [txt[i:i + 25] for i in range(0, len(txt), 25)]
+    transactions, _, _ = page_parallel.parse_pages(pages, 2)
+    assert transactions == b.parse_text(txt)
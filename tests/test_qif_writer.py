@@ -0,0 +1,30 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+import betterment_pdf_to_qif as b
+
+
+def fee_pay(goal):
+    return b.Transaction(b.TransactionKind.FEE_PAY, goal=goal,
+                         date=datetime.date(2016, 1, 10), amount=Decimal('-2.50'))
+
+
+def test_goal_without_transactions_loses_its_old_file(tmp_path):
+    fn = str(tmp_path / 'statement')
+    b.create_qif([fee_pay('build wealth'), fee_pay('world cup')], fn)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'statement-build_wealth.qif', 'statement-world_cup.qif']
+
+    b.create_qif([fee_pay('build wealth')], fn)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['statement-build_wealth.qif']
+
+
+def test_failed_write_leaves_old_files(tmp_path):
+    fn = str(tmp_path / 'statement')
+    b.create_qif([fee_pay('build wealth'), fee_pay('world cup')], fn)
+    with pytest.raises(ValueError):
+        b.create_qif([fee_pay('build wealth'), fee_pay(None)], fn)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'statement-build_wealth.qif', 'statement-world_cup.qif']
@@ -0,0 +1,25 @@
+import os
+import multiprocessing
+
+import pytest
+
+import betterment_pdf_to_qif as b
+
+
+def fake_run(fn, *args, **kwargs):
+    if 'die' in os.path.basename(fn):
+        os._exit(1)
+    open(fn[:-4] + '-build_wealth.qif', 'w').close()
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                    reason="the workers have to inherit the patched run()")
+def test_batch_goes_on_after_a_worker_dies(tmp_path, monkeypatch):
+    monkeypatch.setattr(b, 'run', fake_run)
+    for name in ['a.pdf', 'die.pdf', 'z1.pdf', 'z2.pdf', 'z3.pdf']:
+        (tmp_path / name).write_bytes(b'')
+    errors = b.run_batch(str(tmp_path), workers=1)
+    assert list(errors) == [str(tmp_path / 'die.pdf')]
+    assert 'BrokenProcessPool' in errors[str(tmp_path / 'die.pdf')]
+    for name in ['a', 'z1', 'z2', 'z3']:
+        assert (tmp_path / f'{name}-build_wealth.qif').exists()
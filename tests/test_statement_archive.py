@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+import betterment_pdf_to_qif as b
+from statement_archive import StatementArchive
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from synthetic_statement import statement_lines, archive_lines, tokenized
+
+STATEMENTS = {
+    '2016-q1.pdf': tokenized(statement_lines(seed=0), lower=False),
+    '2016-q2.pdf': tokenized(statement_lines(seed=1), lower=False),
+    # goals that come round again, as in a multi-year export
+    'export.pdf': tokenized(archive_lines(3, seed=2), lower=False),
+}
+
+
+@pytest.fixture(scope='module')
+def archive(tmp_path_factory):
+    with StatementArchive(str(tmp_path_factory.mktemp('archive') / 'statements.archive')) as archive:
+        for name, tokens in STATEMENTS.items():
+            archive.add(name, tokens)
+        yield archive
+
+
+@pytest.mark.parametrize('name', list(STATEMENTS))
+@pytest.mark.parametrize('goal', ['build wealth', 'world cup'])
+def test_goal_parses_as_in_the_whole_statement(archive, name, goal):
+    expected = [t for t in b.parse_text(b.lowercase(STATEMENTS[name])) if t.goal == goal]
+    assert expected
+    assert archive.transactions(name, goal) == expected
+
+
+@pytest.mark.parametrize('name', list(STATEMENTS))
+def test_whole_statement(archive, name):
+    assert archive.transactions(name) == b.parse_text(b.lowercase(STATEMENTS[name]))
+
+
+def test_reopened_archive(archive):
+    # the index is written when the archive is closed
+    archive.close()
+    with StatementArchive(archive.path) as again:
+        assert again.names() == list(STATEMENTS)
+        assert again.transactions('export.pdf', 'world cup') == archive.transactions('export.pdf', 'world cup')
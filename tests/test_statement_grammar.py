@@ -0,0 +1,46 @@
+import pytest
+
+import betterment_pdf_to_qif as b
+from statement_grammar import GRAMMAR, Grammar
+
+
+# headers as they've been seen worded, lowercased and split as the
+# parser gets them; the original parser found these by substring
+@pytest.mark.parametrize('header, shape', [
+    ('dividend payment detail', 'dividend'),
+    ('dividend payment detail:', 'dividend'),
+    ('dividend payment details', 'dividend'),
+    ('monthly activity details', 'other'),
+    ('quarterly activity detail (continued)', 'other'),
+    ('build wealth - snapshot activity detail', 'other'),
+])
+def test_section_header_wording(header, shape):
+    assert GRAMMAR.match_section(header.split()) == shape
+
+
+@pytest.mark.parametrize('line', ['dividend payment', 'activity detail', 'monthly activity', ''])
+def test_not_a_section_header(line):
+    assert GRAMMAR.match_section(line.split()) is None
+
+
+def test_first_listed_header_wins():
+    grammar = Grammar({}, {'activity detail': 'other', 'dividend payment detail': 'dividend'})
+    assert grammar.match_section('dividend payment detail activity detail'.split()) == 'other'
+
+
+def test_goal_marker_starts_a_line():
+    assert GRAMMAR.match_goal('build wealth 2016'.split()) == 'build wealth'
+    assert GRAMMAR.match_goal('smart saver'.split()) is None
+    assert GRAMMAR.match_goal('your build wealth goal'.split()) is False
+
+
+def test_reworded_headers_switch_sections():
+    txt = [line.lower().split() for line in [
+        'Build Wealth',
+        'Dividend Payment Detail:',
+        'Jan 10 2016    BND     Synthetic BND Index ETF          $16.19',
+        'Monthly Activity Details',
+        'Jan 10 2016    Automatic Deposit        BND        $50.89      56.399     $2,870.17      43.615     $90,644.55',
+    ]]
+    kinds = [t.kind for t in b.parse_text(txt)]
+    assert kinds == [b.TransactionKind.DIV_PAY, b.TransactionKind.BUY]
@@ -0,0 +1,63 @@
+import pytest
+
+import betterment_pdf_to_qif as b
+from ticker_registry import resolver, write_unknown_log, read_unknown_log
+
+
+def dividend_line(ticker, description, amount='$12.34'):
+    return ['jan', '9', '2016', ticker] + description.lower().split() + [amount]
+
+
+# funds whose names are close to one in tickers.tsv but aren't it
+NEAR_MISSES = [
+    ('schg', 'Schwab US Large-Cap Growth'),            # close to schx
+    ('spmd', 'SPDR Portfolio S&P 400 Mid Cap ETF'),    # close to spsm, S&P 600
+    ('mub2', 'iShares National AMT-Free Muni Bond ETF'),
+]
+
+
+@pytest.mark.parametrize('ticker, description', NEAR_MISSES)
+def test_unknown_fund_is_not_booked(ticker, description):
+    unknown = {}
+    with pytest.raises(ValueError):
+        b.parse_dividend_payment(dividend_line(ticker, description), unknown)
+    assert ticker in unknown
+    assert unknown[ticker][1] == description.lower()
+
+
+@pytest.mark.parametrize('ticker, description', NEAR_MISSES)
+def test_unknown_fund_is_not_booked_by_the_parser(ticker, description):
+    parser = b.StatementParser()
+    lines = [['build', 'wealth'], ['dividend', 'payment', 'detail'],
+             dividend_line(ticker, description), dividend_line('vti', 'vanguard total stock market etf')]
+    transactions = list(b.iter_transactions(lines, parser))
+    assert [t.ticker for t in transactions] == ['vti']
+    assert ticker in parser.unknown
+
+
+def test_suggestions_are_only_suggestions():
+    # the closest name is a different fund, which is why nothing is
+    # booked under it
+    assert resolver.suggest('Schwab US Large-Cap Growth') == 'schx'
+    assert resolver.suggest('SPDR Portfolio S&P 400 Mid Cap ETF') == 'spsm'
+    assert resolver.resolve('schg') is None
+    assert resolver.resolve('schx') == 'schx'
+
+
+def test_unknown_activity_row_is_reported():
+    unknown = {}
+    line = ['jan', '10', '2016', 'automatic', 'deposit', 'schg', '$119.16', '10.732', '$1,278.80']
+    with pytest.raises(ValueError):
+        b.parse_other_activity(line, unknown)
+    assert unknown == {'schg': (None, '')}
+
+
+def test_unknown_log_keeps_earlier_runs(tmp_path):
+    log = str(tmp_path / 'unknown-tickers.tsv')
+    write_unknown_log(log, {'schg': {'suggestion': 'schx', 'description': 'schwab us large-cap growth',
+                                     'statements': ['a.pdf']}})
+    write_unknown_log(log, {'schg': {'suggestion': None, 'description': '',
+                                     'statements': ['b.pdf']}})
+    assert read_unknown_log(log) == {'schg': {'suggestion': 'schx',
+                                              'description': 'schwab us large-cap growth',
+                                              'statements': ['a.pdf', 'b.pdf']}}
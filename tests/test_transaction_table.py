@@ -0,0 +1,34 @@
+import os
+import sys
+import collections
+
+import pytest
+
+pytest.importorskip('numpy')
+
+import betterment_pdf_to_qif as b
+from transaction_table import TransactionTable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from synthetic_statement import statement_lines, archive_lines, tokenized
+
+
+def test_rows_round_trip():
+    transactions = b.parse_text(tokenized(statement_lines(seed=1)))
+    table = TransactionTable(transactions)
+    assert [table.transaction(i) for i in range(len(table))] == transactions
+
+
+def test_fee_payments_are_per_goal_and_date():
+    # three copies of a statement: with_fee_payments pays each copy's
+    # fee sells separately, the table one total per goal and date
+    transactions = b.parse_text(tokenized(archive_lines(3)))
+    streamed = collections.defaultdict(list)
+    for t in transactions:
+        if t.kind is b.TransactionKind.FEE_PAY:
+            streamed[(t.goal, t.date)].append(t.amount)
+    assert all(len(amounts) == 3 for amounts in streamed.values())
+
+    table = TransactionTable(transactions)
+    assert {(goal, date): amount for goal, date, amount in table.fee_payments()} == \
+        {key: sum(amounts) for key, amounts in streamed.items()}
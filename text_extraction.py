@@ -0,0 +1,152 @@
+"""
+Ways of getting the text out of a statement PDF.
+
+Each backend is a function that takes the PDF's file name and yields
+its lines as strings, laid out like `pdftotext -layout` would lay them
+out -- or at least close enough that splitting each line on whitespace
+gives the same tokens, which is all parse_text cares about.
+
+Each also has a page-by-page version, in PAGE_BACKENDS, that yields a
+list of lines per page instead, for parsing pages in parallel.
+"""
+
+import subprocess
+import collections
+
+
+def pdftotext_args(fn, page_breaks=False):
+    if page_breaks:
+        return ['pdftotext', '-layout', fn, '-']
+    return ['pdftotext', '-nopgbrk', '-layout', fn, '-']
+
+
+def pdftotext_lines(fn):
+    """the original way: run poppler's pdftotext and stream its output"""
+    args = pdftotext_args(fn)
+    with subprocess.Popen(args, stdout=subprocess.PIPE) as proc:
+        for line in proc.stdout:
+            # splitlines() to match what we did when we read everything at once
+            yield from line.decode('utf-8').splitlines()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, args)
+
+
+def pdftotext_pages(fn):
+    """pdftotext_lines, but keeping the form feeds pdftotext puts
+    between pages, and yielding each page's lines as a list"""
+    args = pdftotext_args(fn, page_breaks=True)
+    page = []
+    with subprocess.Popen(args, stdout=subprocess.PIPE) as proc:
+        for line in proc.stdout:
+            # a form feed starts each page after the first; split on
+            # it before splitlines(), which would treat it as a line end
+            parts = line.decode('utf-8').split('\f')
+            page.extend(parts[0].splitlines())
+            for part in parts[1:]:
+                yield page
+                page = part.splitlines()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, args)
+    # there's a form feed after the last page, too
+    if page:
+        yield page
+
+
+async def pdftotext_lines_async(fn):
+    """pdftotext_lines for asyncio: the lines come out as pdftotext
+    writes them, and the event loop is free while we wait"""
+    import asyncio
+    args = pdftotext_args(fn)
+    proc = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE)
+    try:
+        async for line in proc.stdout:
+            for s in line.decode('utf-8').splitlines():
+                yield s
+    finally:
+        if not proc.stdout.at_eof():
+            # we were stopped partway through
+            proc.kill()
+        returncode = await proc.wait()
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, args)
+
+
+def pdfminer_lines(fn):
+    """in-process extraction with pdfminer.six; no subprocess, no poppler.
+    See pdfminer_pages."""
+    for page in pdfminer_pages(fn):
+        yield from page
+
+
+def pdfminer_pages(fn):
+    """the lines of each page, as extracted with pdfminer.six.
+
+    We skip pdfminer's own layout analysis, which groups text into
+    boxes and can reorder the columns of a table, and instead put the
+    characters back into rows by their position on the page.
+    """
+    try:
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTChar, LTContainer
+    except ImportError:
+        raise ImportError('the pdfminer backend needs pdfminer.six: pip install pdfminer.six')
+
+    def chars(item):
+        if isinstance(item, LTChar):
+            yield item
+        elif isinstance(item, LTContainer):
+            for child in item:
+                yield from chars(child)
+
+    for page in extract_pages(fn, laparams=None):
+        # characters on one line of text share a baseline, give or take
+        # a little for different fonts; group anything within half a
+        # character height of the line's first character
+        rows = []
+        for char in sorted(chars(page), key=lambda c: -c.y0):
+            if rows and rows[-1][0] - char.y0 < char.height / 2:
+                rows[-1][1].append(char)
+            else:
+                rows.append((char.y0, [char]))
+
+        lines = []
+        for _, row in rows:
+            pieces = []
+            prev = None
+            for char in sorted(row, key=lambda c: c.x0):
+                # a gap wider than a quarter of a character is a word break
+                if prev is not None and char.x0 - prev.x1 > char.width / 4:
+                    pieces.append(' ')
+                pieces.append(char.get_text())
+                prev = char
+            lines.append(''.join(pieces))
+        yield lines
+
+
+BACKENDS = collections.OrderedDict([
+    ('pdftotext', pdftotext_lines),
+    ('pdfminer', pdfminer_lines),
+])
+
+
+PAGE_BACKENDS = collections.OrderedDict([
+    ('pdftotext', pdftotext_pages),
+    ('pdfminer', pdfminer_pages),
+])
+
+
+def _backend(backends, backend):
+    try:
+        return backends[backend]
+    except KeyError:
+        raise ValueError(f"unknown extraction backend '{backend}'; choose from {', '.join(backends)}")
+
+
+def extract_lines(fn, backend='pdftotext'):
+    """yield the lines of text in the statement using the named backend"""
+    return _backend(BACKENDS, backend)(fn)
+
+
+def extract_pages(fn, backend='pdftotext'):
+    """yield a list of the lines on each page of the statement"""
+    return _backend(PAGE_BACKENDS, backend)(fn)
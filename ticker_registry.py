@@ -0,0 +1,136 @@
+"""
+The funds we know about: ticker symbol (lowercase) to the security
+name the QIF files use. Kept apart from the parser, with no imports to
+speak of, so that anything needing only the names -- compare-holdings.py,
+the benchmarks -- gets them without loading the rest.
+
+The names are read from tickers.tsv next to this file, then from each
+file listed in the BETTERMENT_TICKERS environment variable (separated
+like PATH), so a new fund can be added without touching the code. Lines
+are ticker, a tab, and the name; blank lines and lines starting with #
+are skipped, and a later file wins over an earlier one.
+
+Rows for a ticker that isn't in the table are never booked; the parser
+collects the tickers, and they're written to a log (write_unknown_log)
+so a batch run reports every one it came across at once. `resolver`
+suggests, from a row's fund description, which fund in the table it
+might be -- only a suggestion, for whoever adds the ticker: close names
+are often different funds (Large-Cap Growth and Large-Cap, S&P 400 and
+S&P 600).
+"""
+
+import os
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tickers.tsv')
+ENV_VAR = 'BETTERMENT_TICKERS'
+
+
+def read_tickers(fn, into=None):
+    """add the tickers in fn to the dictionary `into` (a new one by
+    default) and return it"""
+    if into is None:
+        into = {}
+    with open(fn, encoding='utf-8') as f:
+        for num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            ticker, sep, name = line.partition('\t')
+            if not sep or not name.strip():
+                raise ValueError(f'{fn}:{num}: expected a ticker, a tab, and a name')
+            into[ticker.strip().lower()] = name.strip()
+    return into
+
+
+def data_files():
+    """tickers.tsv, then whatever BETTERMENT_TICKERS lists"""
+    extra = os.environ.get(ENV_VAR, '')
+    return [DATA_FILE] + [fn for fn in extra.split(os.pathsep) if fn]
+
+
+def load():
+    ret = {}
+    for fn in data_files():
+        read_tickers(fn, ret)
+    return ret
+
+
+class SecurityResolver:
+    """Which fund is a statement row about? A ticker in the table is
+    its own answer. For one that isn't, suggest() offers the fund whose
+    security name is closest to the row's description ('ishares
+    national amt-free muni bond etf'), for the unknown-ticker log.
+    Suggestions are remembered, LRU fashion, since the same few unknown
+    funds turn up on row after row.
+    """
+
+    def __init__(self, names, cutoff=0.85, maxsize=256):
+        import functools
+        self.names = names
+        self.cutoff = cutoff
+        self.by_description = functools.lru_cache(maxsize=maxsize)(self._by_description)
+
+    def resolve(self, token):
+        """token if it's a ticker in the table, else None"""
+        return token if token in self.names else None
+
+    def suggest(self, description):
+        """the ticker of the fund named most like description, or None"""
+        if not description:
+            return None
+        return self.by_description(' '.join(description.lower().split()))
+
+    def _by_description(self, description):
+        import difflib
+        tickers = {name.lower(): ticker for ticker, name in self.names.items()}
+        match = difflib.get_close_matches(description, list(tickers), n=1, cutoff=self.cutoff)
+        return tickers[match[0]] if match else None
+
+
+def read_unknown_log(fn):
+    """{ticker: {'suggestion': ..., 'description': ..., 'statements':
+    [...]}} from a log written by write_unknown_log; empty if there
+    isn't one yet"""
+    ret = {}
+    try:
+        f = open(fn, encoding='utf-8')
+    except FileNotFoundError:
+        return ret
+    with f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            ticker, suggestion, description, *statements = line.rstrip('\n').split('\t')
+            ret[ticker] = {'suggestion': suggestion or None,
+                           'description': description,
+                           'statements': statements}
+    return ret
+
+
+def write_unknown_log(fn, unknown):
+    """add the unknown tickers from a run (as in
+    PipelineStats.unknown_tickers) to the log in fn, keeping what's
+    already there. Lines are the ticker, the known ticker whose name is
+    closest to its description (blank if none), the description, and
+    the statements it was seen in, separated by tabs."""
+    log = read_unknown_log(fn)
+    for ticker, entry in unknown.items():
+        old = log.setdefault(ticker, {'suggestion': None, 'description': '', 'statements': []})
+        old['suggestion'] = entry['suggestion'] or old['suggestion']
+        old['description'] = entry['description'] or old['description']
+        old['statements'] = sorted(set(old['statements']) | set(entry['statements']))
+    tmp = fn + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write('# tickers missing from tickers.tsv, whose rows were skipped: ticker,\n'
+                '# the known fund with the closest name (a guess; check it), description,\n'
+                '# and the statements it was seen in. Add each one to tickers.tsv (or a\n'
+                '# BETTERMENT_TICKERS file) and rerun.\n')
+        for ticker, entry in sorted(log.items()):
+            fields = [ticker, entry['suggestion'] or '', entry['description']] + entry['statements']
+            f.write('\t'.join(fields) + '\n')
+    os.replace(tmp, fn)
+    return log
+
+
+ticker_to_name = load()
+resolver = SecurityResolver(ticker_to_name)
@@ -0,0 +1,81 @@
+"""
+The statement token files (<pdf>-debug.txt): the non-blank lines of a
+statement, each split on whitespace. betterment_pdf_to_qif.py writes
+them and compare-holdings.py reads them.
+
+The format is JSON Lines: a header line
+
+    {"format": "betterment-tokens", "version": 1}
+
+then one JSON array of strings per line of the statement. Older files
+have a Python list repr on each line instead; read_tokens still reads
+those (with ast.literal_eval, never eval), and
+
+    python token_format.py statement.pdf-debug.txt ...
+
+rewrites them in the new format.
+"""
+
+import os
+import sys
+import json
+
+FORMAT = 'betterment-tokens'
+VERSION = 1
+HEADER = json.dumps({'format': FORMAT, 'version': VERSION})
+
+
+def write_header(f):
+    f.write(HEADER + '\n')
+
+
+def write_line(line, f):
+    f.write(json.dumps(line, ensure_ascii=False) + '\n')
+
+
+def write_tokens(txt, f):
+    """pass the tokenized lines through, writing each to the open file f"""
+    write_header(f)
+    for line in txt:
+        write_line(line, f)
+        yield line
+
+
+def read_tokens(fn):
+    """yield the tokenized lines in a token file, one at a time"""
+    with open(fn, encoding='utf-8') as f:
+        first = f.readline()
+        if not first:
+            return
+        try:
+            header = json.loads(first)
+        except ValueError:
+            header = None
+        if isinstance(header, dict):
+            if header.get('format') != FORMAT or header.get('version') != VERSION:
+                raise ValueError(f'{fn}: unsupported token file {header}')
+            for line in f:
+                yield json.loads(line)
+        else:
+            # the old repr-per-line format
+            import ast
+            yield ast.literal_eval(first)
+            for line in f:
+                yield ast.literal_eval(line)
+
+
+def convert(fn, new_fn=None):
+    """rewrite a token file (of either format) in the current format;
+    by default, in place"""
+    if new_fn is None:
+        new_fn = fn
+    tmp = new_fn + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for _ in write_tokens(read_tokens(fn), f):
+            pass
+    os.replace(tmp, new_fn)
+
+
+if __name__ == '__main__':
+    for fn in sys.argv[1:]:
+        convert(fn)
@@ -0,0 +1,258 @@
+"""
+The parsed transactions of a whole archive as columns of NumPy arrays,
+for when there are too many to loop over one Transaction at a time.
+
+    python transaction_table.py statements/*.pdf [--parquet out.parquet] [--feather out.feather]
+
+Each column is a typed array: dates as datetime64[D]; goal, ticker,
+description and kind as small integer codes into the goals, tickers,
+descs and KINDS lists;
+prices and amounts in cents and shares in millionths of a share, all
+int64, so sums are exact. The fee totals, per-ticker share balances,
+dividends per period and the share rounding check from the README are
+then group-bys over whole arrays.
+
+Needs numpy; writing Parquet or Feather also needs pyarrow.
+"""
+
+from decimal import Decimal
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError('transaction_table needs numpy: pip install numpy')
+
+from betterment_pdf_to_qif import TransactionKind, Transaction
+from holdings_ledger import SHARE_KINDS, goal_key
+
+KINDS = list(TransactionKind)
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+SHARE_KIND_CODES = np.array(sorted(KIND_CODES[kind] for kind in SHARE_KINDS), dtype=np.int8)
+
+CENTS = 2
+MICROSHARES = 6
+
+
+def _scaled(x, places):
+    return int(x.scaleb(places).to_integral_value())
+
+
+def _decimal(n, places):
+    return Decimal(int(n)).scaleb(-places)
+
+
+class TransactionTable:
+    def __init__(self, transactions):
+        self.goals = []
+        self.tickers = []
+        self.descs = []
+        goal_codes = {}
+        ticker_codes = {}
+        desc_codes = {}
+        cols = {name: [] for name in ('date', 'goal', 'ticker', 'desc', 'kind', 'price',
+                                      'shares', 'reported_shares', 'amount')}
+        for trans in transactions:
+            if trans.goal not in goal_codes:
+                goal_codes[trans.goal] = len(self.goals)
+                self.goals.append(trans.goal)
+            if trans.ticker is None:
+                ticker = -1
+            else:
+                if trans.ticker not in ticker_codes:
+                    ticker_codes[trans.ticker] = len(self.tickers)
+                    self.tickers.append(trans.ticker)
+                ticker = ticker_codes[trans.ticker]
+            # only dividend payments have a description
+            if trans.desc is None:
+                desc = -1
+            else:
+                if trans.desc not in desc_codes:
+                    desc_codes[trans.desc] = len(self.descs)
+                    self.descs.append(trans.desc)
+                desc = desc_codes[trans.desc]
+            cols['date'].append(trans.date)
+            cols['goal'].append(goal_codes[trans.goal])
+            cols['ticker'].append(ticker)
+            cols['desc'].append(desc)
+            cols['kind'].append(KIND_CODES[trans.kind])
+            # dividend and fee payments have no price or shares, so
+            # those are 0 here, and fee payments have no ticker (-1)
+            cols['price'].append(0 if trans.share_price is None else _scaled(trans.share_price, CENTS))
+            cols['shares'].append(0 if trans.shares is None else _scaled(trans.shares, MICROSHARES))
+            cols['reported_shares'].append(0 if trans.reported_shares is None
+                                           else _scaled(trans.reported_shares, MICROSHARES))
+            cols['amount'].append(_scaled(trans.amount, CENTS))
+
+        self.date = np.array(cols['date'], dtype='datetime64[D]')
+        self.goal = np.array(cols['goal'], dtype=np.int8)
+        self.ticker = np.array(cols['ticker'], dtype=np.int16)
+        self.desc = np.array(cols['desc'], dtype=np.int32)
+        self.kind = np.array(cols['kind'], dtype=np.int8)
+        self.price = np.array(cols['price'], dtype=np.int64)
+        self.shares = np.array(cols['shares'], dtype=np.int64)
+        self.reported_shares = np.array(cols['reported_shares'], dtype=np.int64)
+        self.amount = np.array(cols['amount'], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.kind)
+
+    def transaction(self, i):
+        """row i as a Transaction again"""
+        kind = KINDS[self.kind[i]]
+        has_shares = kind in SHARE_KINDS
+        return Transaction(kind,
+                           goal=self.goals[self.goal[i]],
+                           date=self.date[i].item(),
+                           ticker=self.tickers[self.ticker[i]] if self.ticker[i] >= 0 else None,
+                           desc=self.descs[self.desc[i]] if self.desc[i] >= 0 else None,
+                           share_price=_decimal(self.price[i], CENTS) if has_shares else None,
+                           shares=_decimal(self.shares[i], MICROSHARES) if has_shares else None,
+                           amount=_decimal(self.amount[i], CENTS),
+                           reported_shares=_decimal(self.reported_shares[i], MICROSHARES) if has_shares else None)
+
+    def group_sum(self, mask, keys, values):
+        """sum values[mask] grouped on the columns in keys; returns the
+        distinct key rows (sorted) and the total for each"""
+        stacked = np.stack([np.asarray(k[mask], dtype=np.int64) for k in keys], axis=1)
+        groups, inverse = np.unique(stacked, axis=0, return_inverse=True)
+        totals = np.zeros(len(groups), dtype=np.int64)
+        np.add.at(totals, inverse.ravel(), values[mask])
+        return groups, totals
+
+    def fee_payments(self):
+        """[(goal, date, amount)] of the fees paid: the fee sells summed
+        by goal and date over the whole table. with_fee_payments adds
+        one payment per run of fee sells instead, so where a goal and
+        date come round more than once (overlapping statements, say)
+        this is the sum of its payments."""
+        mask = self.kind == KIND_CODES[TransactionKind.FEE_SELL]
+        groups, totals = self.group_sum(mask, [self.goal, self.date.astype(np.int64)], self.amount)
+        return [(self.goals[goal], np.datetime64(int(day), 'D').item(), abs(_decimal(total, CENTS)))
+                for (goal, day), total in zip(groups, totals)]
+
+    def share_totals(self):
+        """{(goal, ticker): shares} after every transaction, with goals
+        named as holdings_ledger does"""
+        mask = np.isin(self.kind, SHARE_KIND_CODES)
+        groups, totals = self.group_sum(mask, [self.goal, self.ticker], self.shares)
+        return {(goal_key(self.goals[goal]), self.tickers[ticker]): _decimal(total, MICROSHARES)
+                for (goal, ticker), total in zip(groups, totals)}
+
+    def dividends(self, period='quarter'):
+        """{(goal, first day of the period): total dividends paid}, by
+        'month', 'quarter' or 'year'"""
+        months = self.date.astype('datetime64[M]').astype(np.int64)
+        if period == 'quarter':
+            months = months - months % 3
+        elif period == 'year':
+            months = months - months % 12
+        elif period != 'month':
+            raise ValueError(f'unknown period {period!r}')
+        mask = self.kind == KIND_CODES[TransactionKind.DIV_PAY]
+        groups, totals = self.group_sum(mask, [self.goal, months], self.amount)
+        return {(self.goals[goal], np.datetime64(int(month), 'M').astype('datetime64[D]').item()):
+                _decimal(total, CENTS)
+                for (goal, month), total in zip(groups, totals)}
+
+    def rounding_check(self, tolerance=Decimal('0.001')):
+        """the README's rounding problem, for every (goal, ticker): the
+        shares the statements report, summed, against the shares we
+        compute from price and amount. Returns {(goal, ticker):
+        (reported, computed, difference)} for the ones that differ by
+        at least tolerance."""
+        mask = np.isin(self.kind, SHARE_KIND_CODES)
+        groups, diffs = self.group_sum(mask, [self.goal, self.ticker],
+                                       self.shares - self.reported_shares)
+        _, reported = self.group_sum(mask, [self.goal, self.ticker], self.reported_shares)
+        limit = _scaled(tolerance, MICROSHARES)
+        ret = {}
+        for i in np.flatnonzero(np.abs(diffs) >= limit):
+            goal, ticker = groups[i]
+            ret[(goal_key(self.goals[goal]), self.tickers[ticker])] = (
+                _decimal(reported[i], MICROSHARES),
+                _decimal(reported[i] + diffs[i], MICROSHARES),
+                _decimal(diffs[i], MICROSHARES))
+        return ret
+
+    def to_arrow(self):
+        """a pyarrow Table: goal, ticker, description and kind
+        dictionary-encoded, money and shares as exact decimals, nulls
+        where a payment has no ticker, description, price or shares"""
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError('Parquet and Feather export need pyarrow: pip install pyarrow')
+        has_shares = np.isin(self.kind, SHARE_KIND_CODES)
+
+        def dictionary(codes, values, valid=None):
+            indices = pa.array(codes.astype(np.int32), mask=None if valid is None else ~valid)
+            return pa.DictionaryArray.from_arrays(indices, pa.array(values, pa.string()))
+
+        def decimals(values, places, valid=None):
+            # decimal128 is 16-byte little-endian two's complement, so an
+            # int64 column plus its sign extension is already one
+            words = np.empty((len(values), 2), dtype=np.int64)
+            words[:, 0] = values
+            words[:, 1] = values >> 63
+            validity = None
+            if valid is not None:
+                validity = pa.py_buffer(np.packbits(valid, bitorder='little'))
+            return pa.Array.from_buffers(pa.decimal128(18, places), len(values),
+                                         [validity, pa.py_buffer(words)])
+
+        return pa.table({
+            'date': pa.array(self.date),
+            'goal': dictionary(self.goal, [str(g) for g in self.goals]),
+            'ticker': dictionary(self.ticker, self.tickers, self.ticker >= 0),
+            'desc': dictionary(self.desc, self.descs, self.desc >= 0),
+            'kind': dictionary(self.kind, [kind.value for kind in KINDS]),
+            'share_price': decimals(self.price, CENTS, has_shares),
+            'shares': decimals(self.shares, MICROSHARES, has_shares),
+            'reported_shares': decimals(self.reported_shares, MICROSHARES, has_shares),
+            'amount': decimals(self.amount, CENTS),
+        })
+
+    def write_parquet(self, fn):
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(self.to_arrow(), fn)
+
+    def write_feather(self, fn):
+        import pyarrow.feather
+        pyarrow.feather.write_feather(self.to_arrow(), fn)
+
+
+if __name__ == '__main__':
+    import argparse
+    from betterment_pdf_to_qif import statement_tokens, lowercase, iter_transactions, with_fee_payments
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("statements", nargs='+', help="statement PDFs")
+    parser.add_argument("--backend", default='pdftotext')
+    parser.add_argument("--parquet", metavar="FILE", help="write the table as Parquet")
+    parser.add_argument("--feather", metavar="FILE", help="write the table as Feather")
+    parser.add_argument("--period", default='quarter', choices=['month', 'quarter', 'year'],
+                        help="dividend totals per month, quarter (default) or year")
+    args = parser.parse_args()
+
+    def transactions():
+        for fn in args.statements:
+            yield from with_fee_payments(iter_transactions(lowercase(statement_tokens(fn, args.backend))))
+
+    table = TransactionTable(transactions())
+    print(f'{len(table)} transactions')
+    print('\nfees paid:')
+    for goal, date, amount in table.fee_payments():
+        print(f'  {goal:<14} {date}  {amount:>12}')
+    print(f'\ndividends by {args.period}:')
+    for (goal, start), amount in sorted(table.dividends(args.period).items()):
+        print(f'  {goal:<14} {start}  {amount:>12}')
+    print('\nshares:')
+    for (goal, ticker), shares in sorted(table.share_totals().items()):
+        print(f'  {goal:<14} {ticker:<6} {shares:>16}')
+    print('\nreported shares that are off from price and amount:')
+    for (goal, ticker), (reported, computed, diff) in sorted(table.rounding_check().items()):
+        print(f'  {goal:<14} {ticker:<6} reported {reported}, computed {computed}, off by {diff}')
+    if args.parquet:
+        table.write_parquet(args.parquet)
+    if args.feather:
+        table.write_feather(args.feather)
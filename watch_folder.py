@@ -0,0 +1,153 @@
+"""
+Keep an eye on an inbox directory and convert each statement PDF that
+lands there.
+
+The directory is watched with inotify when the inotify_simple package
+is installed (pip install inotify_simple), and polled otherwise.
+Either way, a PDF is only handed over once its size and modification
+time have stayed put for `settle` seconds, so a download that's still
+being written isn't converted half-done; a PDF that changes again
+later is converted again.
+
+Statements are converted by a pool of worker processes that lives as
+long as the watch does, so each one has imported the parser and built
+its tables once, and a new statement costs only its own extraction
+and parsing. No more than two statements per worker are handed to the
+pool at a time; the rest wait their turn here. A worker that dies
+takes the statements the pool was running with it; they're reported as
+failed, a new pool is started, and the watch goes on.
+
+A statement that fails isn't tried again until it changes.
+"""
+
+import os
+import sys
+import time
+import concurrent.futures
+import concurrent.futures.process
+
+
+def pdf_signatures(directory):
+    """{path: (size, mtime)} of the PDFs in directory"""
+    ret = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.name.lower().endswith('.pdf'):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.is_file():
+                ret[entry.path] = (st.st_size, st.st_mtime_ns)
+    return ret
+
+
+class DirectoryEvents:
+    """wait() returns once something in the directory may have
+    changed, or after `timeout` seconds; with inotify that's as soon as
+    a file is written or moved in, without it, every time"""
+
+    def __init__(self, directory):
+        self.inotify = None
+        try:
+            from inotify_simple import INotify, flags
+        except ImportError:
+            return
+        self.inotify = INotify()
+        self.inotify.add_watch(directory, flags.CLOSE_WRITE | flags.MOVED_TO | flags.MODIFY)
+
+    def wait(self, timeout):
+        if self.inotify is None:
+            time.sleep(timeout)
+        else:
+            self.inotify.read(timeout=int(timeout * 1000))
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+
+
+def watch(directory, convert, workers=None, settle=2.0, poll_interval=1.0,
+          on_result=None, stop=None):
+    """run convert(path) in a worker process for each PDF that shows up
+    in directory (and each one already there) until stop() returns
+    true, or forever.
+
+    convert has to be picklable -- a module-level function or a
+    functools.partial of one -- and returns (path, error, stats) like
+    betterment_pdf_to_qif._run_one; on_result is called with each of
+    those as it comes back.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    events = DirectoryEvents(directory)
+    # path -> (size, mtime) of the version we've converted or queued
+    done = {}
+    # path -> ((size, mtime), when we first saw it that way)
+    pending = {}
+    queued = []
+    running = {}
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    broken = False
+    try:
+        while stop is None or not stop():
+            now = time.monotonic()
+            for path, sig in pdf_signatures(directory).items():
+                if done.get(path) == sig:
+                    continue
+                seen = pending.get(path)
+                if seen is None or seen[0] != sig:
+                    pending[path] = (sig, now)
+                elif now - seen[1] >= settle and path not in queued and path not in running.values():
+                    del pending[path]
+                    done[path] = sig
+                    queued.append(path)
+
+            # a worker that dies takes the pool down with it, and every
+            # statement it was running fails; once they've all come
+            # back, start a new pool and carry on
+            if broken and not running:
+                pool.shutdown()
+                pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+                broken = False
+
+            while queued and not broken and len(running) < 2 * workers:
+                try:
+                    future = pool.submit(convert, queued[0])
+                except concurrent.futures.process.BrokenProcessPool:
+                    broken = True
+                    break
+                running[future] = queued.pop(0)
+
+            for future in [f for f in running if f.done()]:
+                path = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as err:
+                    # the worker died; done still has the version we
+                    # tried, so this file is tried again once it changes
+                    if isinstance(err, concurrent.futures.process.BrokenProcessPool):
+                        broken = True
+                    result = (path, f'{type(err).__name__}: {err}', None)
+                if on_result is not None:
+                    on_result(result)
+
+            # settle sooner than the poll interval if something's waiting
+            timeout = poll_interval
+            if pending:
+                timeout = min(timeout, settle / 2)
+            if running or broken:
+                timeout = min(timeout, 0.1)
+            events.wait(timeout)
+    finally:
+        pool.shutdown()
+        events.close()
+
+
+def report(result):
+    fn, err, stats = result
+    if err is None:
+        print(f'converted {fn}', file=sys.stderr)
+    else:
+        print(f'{fn}: {err}', file=sys.stderr)